@@ -0,0 +1,233 @@
+""" Benchmarks of the registry and dynamic tables hot paths
+
+Run from the repository root:
+
+    python benchmarks/bench.py --output results.json
+
+Every benchmark runs on a SQLite database in memory and in a file.
+Results are written as json: run metadata and one entry per measure,
+with its duration in seconds and its throughput, so that runs can be
+compared over time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynalchemy import Registry  # noqa: E402
+
+DATABASES = ('memory', 'file')
+COLUMNS = [
+    dict(name='name', kind='String', length=50),
+    dict(name='size', kind='Integer'),
+    dict(name='weight', kind='Float'),
+    dict(name='born', kind='DateTime'),
+]
+# columns added to a table by bench_add before moving to the next one,
+# SQLite tables are limited to 2000 columns
+COLUMNS_PER_TABLE = 1000
+
+
+class Database(object):
+    """ Empty SQLite database, in memory or in a temporary file """
+
+    def __init__(self, kind):
+
+        self.kind = kind
+        self.tmpdir = None
+        if kind == 'memory':
+            url = 'sqlite:///:memory:'
+        else:
+            self.tmpdir = tempfile.mkdtemp()
+            url = 'sqlite:///%s' % os.path.join(self.tmpdir, 'bench.sqlite')
+        self.engine = create_engine(url)
+
+    def registry(self, **kwargs):
+        """ New Registry on a new declarative base """
+
+        base = declarative_base(bind=self.engine)
+        return Registry(base, sessionmaker(bind=self.engine)(), **kwargs)
+
+    def close(self):
+        self.engine.dispose()
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def create_tables(reg, count, chunk_size=100):
+    """ count tables in collection bench, added chunk_size at a time """
+
+    for start in range(0, count, chunk_size):
+        reg.add_many([
+            dict(collection='bench', name='t%d' % i, columns=COLUMNS)
+            for i in range(start, min(count, start + chunk_size))])
+
+
+def bench_startup(db, size):
+    create_tables(db.registry(), size)
+    eager, _ = timed(db.registry)
+    lazy, reg = timed(db.registry, lazy=True)
+
+    names = ['t%d' % i for i in range(size)]
+    miss, _ = timed(lambda: [reg.get('bench', name) for name in names])
+    hit, _ = timed(lambda: [reg.get('bench', name) for name in names])
+    return [
+        ('startup', eager, 1),
+        ('startup_lazy', lazy, 1),
+        ('get_miss', miss, size),
+        ('get_hit', hit, size),
+    ]
+
+
+def bench_add(db, size):
+    reg = db.registry()
+    add, _ = timed(lambda: [
+        reg.add('bench', 't%d' % i, columns=COLUMNS) for i in range(size)])
+    add_column, _ = timed(lambda: [
+        reg.add_column('bench', 't%d' % (i // COLUMNS_PER_TABLE),
+                       dict(name='c%d' % i, kind='Integer'))
+        for i in range(size)])
+    return [
+        ('add', add, size),
+        ('add_column', add_column, size),
+    ]
+
+
+def bench_relations(db, size):
+    reg = db.registry()
+    reg.add('bench', 'target', columns=COLUMNS)
+    configs = [dict(collection='bench', name='m%d' % i, columns=[
+        dict(name='name', kind='String'),
+        dict(name='targets', kind='Relation', relation=dict(
+            collection='bench', name='target', cardinality='many',
+            backref='m%d_collection' % i)),
+    ]) for i in range(size)]
+    add, _ = timed(reg.add_many, configs)
+    startup, _ = timed(db.registry)
+    return [
+        ('relations_add_many', add, size),
+        ('relations_startup', startup, 1),
+    ]
+
+
+def bench_rows(db, size):
+    reg = db.registry()
+    Row = reg.add('bench', 'rows', columns=COLUMNS)
+    session = reg.session
+
+    def insert():
+        session.add_all([Row(name='row %d' % i, size=i, weight=i / 2.0)
+                         for i in range(size)])
+        session.commit()
+
+    insert_orm, _ = timed(insert)
+    read_orm, rows = timed(lambda: session.query(Row).all())
+    assert len(rows) == size
+    bulk, _ = timed(reg.bulk_insert, 'bench', 'rows', [
+        dict(name='row %d' % i, size=str(i), weight=i / 2.0)
+        for i in range(size)])
+    return [
+        ('rows_insert_orm', insert_orm, size),
+        ('rows_read_orm', read_orm, size),
+        ('rows_bulk_insert', bulk, size),
+    ]
+
+
+BENCHMARKS = dict(
+    startup=bench_startup,
+    add=bench_add,
+    relations=bench_relations,
+    rows=bench_rows,
+)
+
+
+def run(benchmarks, sizes, row_count, databases):
+    results = []
+    for name in benchmarks:
+        counts = [row_count] if name == 'rows' else sizes
+        for kind in databases:
+            for size in counts:
+                db = Database(kind)
+                try:
+                    measures = BENCHMARKS[name](db, size)
+                finally:
+                    db.close()
+                for measure, seconds, ops in measures:
+                    results.append(dict(
+                        benchmark=name, measure=measure, db=kind,
+                        size=size, seconds=seconds, ops=ops,
+                        ops_per_second=ops / seconds if seconds else None))
+                    print('%-10s %-20s %-6s %6d %10.4fs %12.1f ops/s' % (
+                        name, measure, kind, size, seconds,
+                        results[-1]['ops_per_second'] or 0),
+                        file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--benchmarks', default=','.join(BENCHMARKS),
+        help='comma separated benchmarks among %s' % ', '.join(BENCHMARKS))
+    parser.add_argument(
+        '--sizes', default='10,100,1000,10000',
+        help='comma separated numbers of tables')
+    parser.add_argument(
+        '--rows', type=int, default=10000, help='rows of the rows benchmark')
+    parser.add_argument(
+        '--db', default=','.join(DATABASES),
+        help='comma separated databases among memory, file')
+    parser.add_argument(
+        '--output', help='json results file, printed to stdout if omitted')
+    args = parser.parse_args(argv)
+
+    benchmarks = args.benchmarks.split(',')
+    databases = args.db.split(',')
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+    for kind in databases:
+        if kind not in DATABASES:
+            parser.error('unknown database %s' % kind)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = dict(
+        meta=dict(
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            sqlalchemy=sqlalchemy.__version__,
+            sqlite=sqlite3.sqlite_version,
+            argv=sys.argv[1:] if argv is None else argv,
+        ),
+        results=run(benchmarks, sizes, args.rows, databases),
+    )
+    if args.output:
+        with open(args.output, 'w') as fileobj:
+            json.dump(results, fileobj, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
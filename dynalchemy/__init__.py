@@ -1 +1,2 @@
 from .meta import Registry
+from .aio import AsyncRegistry
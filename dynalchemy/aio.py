@@ -0,0 +1,82 @@
+""" asyncio front of Registry
+
+The sqlalchemy asyncio extension needs sqlalchemy >= 1.4 while Registry
+relies on the 1.3 declarative internals. AsyncRegistry therefore runs a
+regular Registry on a dedicated worker thread: every call is awaitable and
+never blocks the event loop, and calls of one AsyncRegistry are
+serialized, as its session requires. Use one AsyncRegistry per tenant
+to serve them concurrently.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .meta import Registry
+
+# Registry methods exposed as coroutines
+DELEGATED = (
+    'add', 'add_from_config', 'add_many', 'add_column', 'add_columns',
+    'add_index', 'get', 'list', 'deprecate', 'deprecate_column', 'refresh',
+    'backfill', 'bulk_insert', 'bulk_upsert', 'export', 'import_rows',
+    'read_columns', 'validator', 'serializer', 'paginate',
+)
+
+
+class AsyncRegistry(object):
+    """ Awaitable Registry, build it with AsyncRegistry.create
+
+        :param registry: Registry, only used from executor
+        :param executor: single thread executor
+    """
+
+    def __init__(self, registry, executor):
+
+        self.registry = registry
+        self._executor = executor
+
+    @classmethod
+    async def create(cls, base, session, **kwargs):
+        """ Load the catalog on a new worker thread
+
+            :param base: declarative base of the application
+            :param session: sqlalchemy session, only used from the worker
+            :param kwargs: Registry options (lazy, snapshot, max_models)
+            :return: AsyncRegistry
+        """
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_event_loop()
+        registry = await loop.run_in_executor(
+            executor, partial(Registry, base, session, **kwargs))
+        return cls(registry, executor)
+
+    def run(self, func, *args, **kwargs):
+        """ Run func on the worker thread, for instance queries using
+            the registry session
+
+            :return: awaitable result of func
+        """
+
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor, partial(func, *args, **kwargs))
+
+    async def close(self):
+        """ Close the session and stop the worker thread """
+
+        await self.run(self.registry.session.close)
+        self._executor.shutdown(wait=True)
+
+
+def _delegate(name):
+    method = getattr(Registry, name)
+
+    async def call(self, *args, **kwargs):
+        return await self.run(method, self.registry, *args, **kwargs)
+    call.__name__ = name
+    call.__doc__ = method.__doc__
+    return call
+
+
+for _name in DELEGATED:
+    setattr(AsyncRegistry, _name, _delegate(_name))
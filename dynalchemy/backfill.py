@@ -0,0 +1,106 @@
+""" Online backfill of dynamic table columns
+
+Existing rows are updated by ranges of primary key, each range in its
+own short transaction, so the table is never locked as a whole.
+"""
+
+import time
+from collections import namedtuple
+
+from sqlalchemy import and_, bindparam, func, select
+from sqlalchemy.orm.exc import NoResultFound
+
+from .models import InvalidDefinitionException
+
+# checkpoint: last id processed, restart from it to resume
+Progress = namedtuple('Progress', ['checkpoint', 'max_id', 'updated'])
+
+
+class Backfill(object):
+    """ Fill NULL values of one column of a dynamic table
+
+        :param registry: Registry
+        :param collection: collection name - String
+        :param name: table name - String
+        :param colname: column name - String
+        :param value: optional callable receiving a row (id and all
+            columns) and returning the value. Default of the column if None.
+        :param chunk_size: number of ids per range
+        :param pause: seconds to sleep between ranges
+        :param progress: optional callable receiving a Progress after
+            each range
+    """
+
+    def __init__(self, registry, collection, name, colname, value=None,
+                 chunk_size=1000, pause=0, progress=None):
+
+        table = registry._get_dtable(collection, name)
+        try:
+            self.dcol = [col for col in table.get_columns()
+                         if col.name == colname][0]
+        except IndexError:
+            raise NoResultFound('column %s not found' % colname)
+        if value is None and self.dcol.default is None:
+            raise InvalidDefinitionException(
+                'column %s has no default' % colname)
+
+        self.bind = registry.session.get_bind()
+        self.table = registry.get(collection, name).__table__
+        self.column = self.table.c[self.dcol.get_name()]
+        self.value = value
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.progress = progress
+
+    def run(self, checkpoint=0):
+        """ Process all ranges after checkpoint
+
+            :param checkpoint: last id already processed
+            :return: number of rows updated
+        """
+
+        updated = 0
+        for state in self.chunks(checkpoint):
+            updated += state.updated
+        return updated
+
+    def chunks(self, checkpoint=0):
+        """ Generator processing one range per iteration
+
+            :param checkpoint: last id already processed
+            :return: iterator of Progress
+        """
+
+        max_id = self.bind.scalar(select([func.max(self.table.c.id)])) or 0
+        while checkpoint < max_id:
+            end = min(checkpoint + self.chunk_size, max_id)
+            where = and_(self.table.c.id > checkpoint,
+                         self.table.c.id <= end,
+                         self.column.is_(None))
+            with self.bind.begin() as con:
+                updated = self._update(con, where)
+            checkpoint = end
+            state = Progress(checkpoint, max_id, updated)
+            if self.progress is not None:
+                self.progress(state)
+            yield state
+            if self.pause and checkpoint < max_id:
+                time.sleep(self.pause)
+
+    def _update(self, con, where):
+        """ Update rows matching where, return the number of rows """
+
+        if self.value is None:
+            stmt = self.table.update().where(where).values(
+                {self.column: self.dcol._get_default()})
+            return con.execute(stmt).rowcount
+
+        rows = con.execute(self.table.select().where(where)).fetchall()
+        if not rows:
+            return 0
+        stmt = self.table.update()\
+            .where(self.table.c.id == bindparam('_id'))\
+            .values({self.column: bindparam('_value')})
+        con.execute(stmt, [
+            {'_id': row['id'], '_value': self.value(row)} for row in rows])
+        return len(rows)
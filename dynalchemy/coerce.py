@@ -0,0 +1,130 @@
+""" Conversion of raw values (json, csv...) to the python type of a column
+
+Values that do not convert exactly are rejected with a TypeError or a
+ValueError rather than truncated: booleans must be one of the known true
+or false values, integers must not have a fractional part, strings must
+not be containers and binaries must be bytes-like. Numeric values are
+converted to Decimal.
+"""
+
+import datetime
+import math
+from decimal import Decimal, InvalidOperation
+
+TRUE_VALUES = ('t', 'true', 'y', 'yes', 'on', '1')
+FALSE_VALUES = ('f', 'false', 'n', 'no', 'off', '0')
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+    elif isinstance(value, (bool, int)) and value in (0, 1):
+        return bool(value)
+    raise ValueError('%r is not a boolean' % (value,))
+
+
+def to_int(value):
+    if isinstance(value, (float, Decimal)):
+        if not math.isfinite(value) or value % 1:
+            raise ValueError('%r is not an integer' % (value,))
+        return int(value)
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        return int(value)
+    raise TypeError('%r is not an integer' % (value,))
+
+
+def to_decimal(value):
+    if isinstance(value, float):
+        value = repr(value)
+    elif not isinstance(value, (int, str, Decimal)) or \
+            isinstance(value, bool):
+        raise TypeError('%r is not a number' % (value,))
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        raise ValueError('%r is not a number' % (value,))
+    if not value.is_finite():
+        raise ValueError('%r is not a finite number' % (value,))
+    return value
+
+
+def to_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, (int, float, Decimal)) and \
+            not isinstance(value, bool):
+        return str(value)
+    raise TypeError('%r is not a string' % (value,))
+
+
+def to_bytes(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    raise TypeError('%r is not bytes' % (value,))
+
+
+def to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    return datetime.datetime.fromisoformat(value)
+
+
+def to_time(value):
+    if isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(value)
+
+
+# kind: conversion function
+COERCERS = {
+    'BigInteger': to_int,
+    'Binary': to_bytes,
+    'Boolean': to_bool,
+    'CompressedBinary': to_bytes,
+    'CompressedText': to_text,
+    'Date': to_date,
+    'DateTime': to_datetime,
+    'Enum': to_text,
+    'Float': float,
+    'Integer': to_int,
+    'LargeBinary': to_bytes,
+    'Numeric': to_decimal,
+    'SmallInteger': to_int,
+    'String': to_text,
+    'Text': to_text,
+    'Time': to_time,
+}
+
+
+def coercer(dcol):
+    """ Conversion function for a DColumn, None is kept as is
+
+        :param dcol: DColumn
+        :return: callable
+    """
+
+    if dcol.is_parent_relationship():
+        convert = to_int
+    else:
+        convert = COERCERS[dcol.kind]
+
+    def coerce(value):
+        if value is None:
+            return None
+        return convert(value)
+    return coerce
@@ -0,0 +1,103 @@
+""" Columnar reads of dynamic tables into numpy arrays
+
+numpy is an optional dependency, only imported when reading.
+"""
+
+from sqlalchemy import select
+
+# kind: numpy dtype, object for the others
+DTYPES = {
+    'BigInteger': 'int64',
+    'Boolean': 'bool',
+    'Date': 'datetime64[D]',
+    'DateTime': 'datetime64[us]',
+    'Float': 'float64',
+    'Integer': 'int64',
+    'Numeric': 'float64',
+    'SmallInteger': 'int64',
+}
+
+# value used in place of NULL before masking
+FILLERS = {
+    'bool': False,
+    'float64': 0.0,
+    'int64': 0,
+}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('read_columns requires numpy')
+    return numpy
+
+
+def read_columns(con, dtable, table, columns, where=None, chunk_size=10000):
+    """ Read columns of table into numpy arrays, chunk by chunk
+
+        :param con: sqlalchemy connection
+        :param dtable: DTable of the table
+        :param table: sqlalchemy Table
+        :param columns: list of column names (id included)
+        :param where: optional sqlalchemy clause
+        :param chunk_size: rows fetched at a time
+        :return: dict of arrays by column name, masked arrays for
+            nullable columns and the ones holding NULL values anyway
+    """
+
+    numpy = _numpy()
+    dcols = dict((col.name, col) for col in dtable.get_columns()
+                 if not col.is_many_relationship())
+    specs = []
+    for name in columns:
+        if name == 'id':
+            specs.append((name, 'id', 'int64', False))
+            continue
+        try:
+            dcol = dcols[name]
+        except KeyError:
+            raise KeyError('unknown column %s' % name)
+        kind = 'Integer' if dcol.is_parent_relationship() else dcol.kind
+        specs.append((name, dcol.get_name(), DTYPES.get(kind, 'object'),
+                      bool(dcol.nullable)))
+
+    query = select([table.c[colname] for _, colname, _, _ in specs])\
+        .order_by(table.c.id)
+    if where is not None:
+        query = query.where(where)
+    result = con.execution_options(stream_results=True).execute(query)
+
+    chunks = [[] for _ in specs]
+    masks = [[] for _ in specs]
+    # the nullable flag of the catalog is not trusted: rows written
+    # before a column was made mandatory may still be NULL
+    masked = [nullable for _, _, _, nullable in specs]
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        for i, (_, _, dtype, _) in enumerate(specs):
+            values = [row[i] for row in rows]
+            mask = numpy.fromiter(
+                (value is None for value in values), bool, len(values))
+            if mask.any():
+                masked[i] = True
+                if dtype != 'object':
+                    filler = FILLERS.get(dtype)
+                    values = [filler if value is None else value
+                              for value in values]
+            masks[i].append(mask)
+            chunks[i].append(numpy.array(values, dtype=dtype))
+    result.close()
+
+    arrays = {}
+    for i, (name, _, dtype, _) in enumerate(specs):
+        data = numpy.concatenate(chunks[i]) if chunks[i] else \
+            numpy.array([], dtype=dtype)
+        if masked[i]:
+            mask = numpy.concatenate(masks[i]) if masks[i] else \
+                numpy.array([], dtype=bool)
+            data = numpy.ma.MaskedArray(data, mask=mask)
+        arrays[name] = data
+    return arrays
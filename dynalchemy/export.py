@@ -0,0 +1,140 @@
+""" Streaming export & import of dynamic tables data
+
+Formats:
+    * csv: header line with column names, None exported as an empty string
+    * jsonl: one json object per line
+
+Dates and times are exported in iso format, binaries in base64, Numeric
+values as strings, without rounding.
+"""
+
+import base64
+import csv
+import json
+
+from sqlalchemy import select
+
+FORMATS = ('csv', 'jsonl')
+
+
+def _iso(value):
+    return value.isoformat()
+
+
+def _b64encode(value):
+    return base64.b64encode(value).decode('ascii')
+
+
+def _b64decode(value):
+    return base64.b64decode(value)
+
+
+# kind: function converting a python value to a csv/json compatible one
+ENCODERS = {
+    'Binary': _b64encode,
+    'CompressedBinary': _b64encode,
+    'Date': _iso,
+    'DateTime': _iso,
+    'LargeBinary': _b64encode,
+    'Numeric': str,
+    'Time': _iso,
+}
+
+# kind: function converting an exported value back, when the generic
+# conversion of bulk_insert is not enough
+DECODERS = {
+    'Binary': _b64decode,
+    'CompressedBinary': _b64decode,
+    'LargeBinary': _b64decode,
+}
+
+
+def _check_format(fmt):
+    if fmt not in FORMATS:
+        raise ValueError('unknown format %s, expected one of %s' % (
+            fmt, ', '.join(FORMATS)))
+
+
+def _columns(dtable):
+    """ (sa column name, kind) of the exported columns """
+
+    columns = [('id', 'Integer')]
+    for col in dtable.get_columns():
+        if col.is_many_relationship():
+            continue
+        kind = 'Integer' if col.is_parent_relationship() else col.kind
+        columns.append((col.get_name(), kind))
+    return columns
+
+
+def export(con, dtable, table, fmt, fileobj, batch_size=1000):
+    """ Write all rows of table to fileobj, batch_size rows in memory
+
+        :param con: sqlalchemy connection
+        :param dtable: DTable of the table
+        :param table: sqlalchemy Table
+        :param fmt: csv or jsonl
+        :param fileobj: text file
+        :param batch_size: rows fetched at a time
+        :return: number of rows written
+    """
+
+    _check_format(fmt)
+    columns = _columns(dtable)
+    names = [name for name, _ in columns]
+    encoders = [ENCODERS.get(kind) for _, kind in columns]
+    if fmt == 'csv':
+        writer = csv.writer(fileobj)
+        writer.writerow(names)
+    query = select([table.c[name] for name in names]).order_by(table.c.id)
+    result = con.execution_options(stream_results=True).execute(query)
+
+    count = 0
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            values = [
+                value if encode is None or value is None else encode(value)
+                for value, encode in zip(row, encoders)]
+            if fmt == 'csv':
+                writer.writerow(['' if v is None else v for v in values])
+            else:
+                fileobj.write(json.dumps(dict(zip(names, values))))
+                fileobj.write('\n')
+        count += len(rows)
+    result.close()
+    return count
+
+
+def read(dtable, fmt, fileobj):
+    """ Generator of rows read from an export, ready for bulk_insert
+
+        :param dtable: DTable of the table
+        :param fmt: csv or jsonl
+        :param fileobj: text file
+        :return: iterator of dicts
+    """
+
+    _check_format(fmt)
+    columns = dict(_columns(dtable))
+    decoders = dict((name, DECODERS[kind]) for name, kind in columns.items()
+                    if kind in DECODERS)
+    if fmt == 'csv':
+        reader = csv.DictReader(fileobj)
+        for row in reader:
+            yield _decode(dict(
+                (key, None if value == '' else value)
+                for key, value in row.items()), decoders)
+    else:
+        for line in fileobj:
+            if line.strip():
+                yield _decode(json.loads(line), decoders)
+
+
+def _decode(row, decoders):
+    for key, decode in decoders.items():
+        if row.get(key) is not None:
+            row[key] = decode(row[key])
+    return row
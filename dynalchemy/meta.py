@@ -1,38 +1,254 @@
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from itertools import islice
+from threading import RLock
+
+from sqlalchemy import Index, MetaData, Table, inspect, select, union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session, scoped_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.schema import CreateColumn
-from .models import DColumn, DTable
+from .models import Base, DColumn, DGeneration, DTable
+from .models import InvalidDefinitionException, LAZY_STRATEGIES
+from .backfill import Backfill
+from .coerce import coercer, to_int
+from .upsert import upsert
+from . import export as table_export
+from . import columnar
+from . import migrations
+from . import snapshot as catalog_snapshot
+from .stats import Stats
+from .pagination import Paginator
+from .serializers import RowSerializer
+from .validation import RowValidator
 
 
 class TableExistException(Exception):
     pass
 
 
+# measure of the operations when instrumentation is off
+_NOT_MEASURED = nullcontext()
+
+
+def _serialized(method):
+    """ Run a catalog changing method of Registry under its DDL lock """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._ddl_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Registry(object):
-    """ storage for dynamically created classes """
+    """ storage for dynamically created classes
 
-    def __init__(self, base, session):
+        :param base: declarative base of the application
+        :param session: sqlalchemy session
+        :param lazy: if True, models are only built when first requested
+            through get or list. Backrefs declared by a table appear on its
+            targets once that table has been built.
+        :param snapshot: optional path of a local catalog snapshot, used at
+            startup instead of the catalog tables while it is up to date
+        :param max_models: optional cap on the number of models kept
+            in memory. Least recently used ones are disposed of and rebuilt
+            by get when needed. Models linked by relations are disposed of
+            together, models linked to an external class are kept.
+        :param thread_safe: if True, the registry may be shared by threads.
+            session must then be a sessionmaker or a scoped_session: changes
+            go through a session local to the calling thread and catalog
+            reads through short-lived sessions. Models are built once
+            per key and catalog changes are serialized.
+        :param instrument: if True, collect counters and latency histograms
+            of the registry operations, see stats and add_hook
+        :param relation_lazy: default loading strategy of relations and
+            backrefs without their own lazy / backref_lazy, select if None.
+            A dynamic default only applies to collections.
+        :param defer_blobs: if True, columns of the binary and text kinds,
+            compressed ones included, are deferred unless their deferred
+            attribute is False
+    """
 
+    def __init__(self, base, session, lazy=False, snapshot=None,
+                 max_models=None, thread_safe=False, instrument=False,
+                 relation_lazy=None, defer_blobs=False):
+
+        if relation_lazy not in (None,) + LAZY_STRATEGIES:
+            raise InvalidDefinitionException(
+                'unknown loading strategy %s' % relation_lazy)
         self._base = base
+        self.relation_lazy = relation_lazy
+        self.defer_blobs = defer_blobs
+        self._session_factory = None
+        if thread_safe:
+            if isinstance(session, scoped_session):
+                self._session_factory = session.session_factory
+            else:
+                self._session_factory = session
+                session = scoped_session(session)
         self.session = session
+        self.thread_safe = thread_safe
+        self.lazy = lazy
+        self.snapshot = snapshot
+        # catalog of active tables, by collection then name: as in the
+        # unique constraint of DTable, the schema is not part of the key
+        self._collections = {}
+        # schema generation the catalog is up to date with
+        self.generation = 0
+        # resident models by (collection, name), least recently used first
+        self.max_models = max_models
+        self._resident = OrderedDict()
+        self._links = {}
+        self._referrers = {}
+        # catalog changes, model builds, LRU state. A model build resolves
+        # its relations, building their targets: a single lock for all the
+        # builds cannot be taken in conflicting orders by two threads
+        self._ddl_lock = RLock()
+        self._build_lock = RLock()
+        self._building = set()
+        self._lru_lock = RLock()
+        self._stats = Stats() if instrument else None
+        # objects compiled from a table definition, by (collection, name)
+        self._compiled = {}
         self._ensure_meta_tables()
-        self._load_all()
+        if lazy:
+            self._index_all()
+        else:
+            self._load_all()
 
     def _ensure_meta_tables(self):
-        """ Create registry tables in DB if they do not exist"""
+        """ Create registry tables in DB if they do not exist,
+            add the columns introduced since they were created
+        """
 
         bind = self.session.get_bind()
+        if not DGeneration.__table__.exists(bind):
+            DGeneration.__table__.create(bind)
+            bind.execute(DGeneration.__table__.insert(), id=1, value=0)
         if not DTable.__table__.exists(bind):
             DTable.__table__.create(bind)
             DColumn.__table__.create(bind)
+        else:
+            added = dict(
+                (model, self._upgrade_meta_table(bind, model.__table__))
+                for model in (DTable, DColumn))
+            if 'target_name' in added[DColumn]:
+                # catalog written when its fields were pickled
+                with bind.begin() as con:
+                    migrations.pickle_to_json(con)
+            if 'indexes' in added[DTable]:
+                # tables created before foreign keys were indexed
+                with bind.begin() as con:
+                    migrations.index_foreign_keys(con)
+
+    @staticmethod
+    def _upgrade_meta_table(bind, table):
+        """ Add missing columns (and their indexes) to a registry table
+
+            :return: names of the added columns
+        """
+
+        existing = set(
+            col['name'] for col in inspect(bind).get_columns(table.name))
+        missing = [col for col in table.columns if col.name not in existing]
+        if not missing:
+            return []
+        con = bind.connect()
+        with con.begin():
+            for col in missing:
+                con.execute('alter table %s add %s' % (
+                    table.name, CreateColumn(col).compile(bind)))
+            for index in table.indexes:
+                if any(col in missing for col in index.columns):
+                    index.create(con)
+        con.close()
+        return [col.name for col in missing]
 
     def destroy(self):
         """ BEWARE !! - for unit tests mainly """
 
         self.session.close()
         self._base.metadata.drop_all()
-        DColumn.__table__.drop(bind=self.session.get_bind())
-        DTable.__table__.drop(bind=self.session.get_bind())
+        Base.metadata.drop_all(bind=self.session.get_bind())
+
+    def _bump_generation(self):
+        """ Increment the schema generation in the current transaction
+
+            :return: the new generation
+        """
+
+        self.session.query(DGeneration).filter_by(id=1).update(
+            {DGeneration.value: DGeneration.value + 1},
+            synchronize_session=False)
+        return self.session.query(DGeneration.value).filter_by(id=1).scalar()
+
+    def _current_generation(self):
+        """ Last committed schema generation """
+
+        query = select([DGeneration.value]).where(DGeneration.id == 1)
+        with self._measure('catalog_query'):
+            return self.session.get_bind().scalar(query) or 0
+
+    def stats(self):
+        """ Counters and latency histograms of the registry operations
+            since instrumentation was turned on
+
+            :return: dict, see dynalchemy.stats.Stats.snapshot, None if
+                instrumentation is off
+        """
+
+        if self._stats is None:
+            return None
+        return self._stats.snapshot()
+
+    def add_hook(self, hook):
+        """ Forward instrumented events to hook, turns instrumentation on
+
+            :param hook: callable(event, duration), duration in seconds
+                of timed events, None for counted ones
+        """
+
+        if self._stats is None:
+            self._stats = Stats()
+        self._stats.hooks.append(hook)
+
+    def _measure(self, event):
+        """ Context manager timing event when instrumentation is on """
+
+        if self._stats is None:
+            return _NOT_MEASURED
+        return self._stats.measure(event)
+
+    def _count(self, event):
+        """ Count event when instrumentation is on """
+
+        if self._stats is not None:
+            self._stats.incr(event)
 
-    def add(self, collection, name, columns=None, schema=None):
+    def _many_relationship(self, col):
+        """ Relationship of a many relation column """
+
+        with self._measure('relationship'):
+            return col.get_many_relationship(self)
+
+    @contextmanager
+    def _catalog_session(self):
+        """ Session for catalog reads, short-lived in thread safe mode """
+
+        if self._session_factory is None:
+            yield self.session
+            return
+        session = self._session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def add(self, collection, name, columns=None, schema=None,
+            unique_keys=None, indexes=None):
         """ Add a new table:
             - insert definitions in DTable & DColumn
             - Create sql table
@@ -42,50 +258,147 @@ class Registry(object):
             :param name: table name, string
             :param columns: dictionary of columns definitions
             :param schema: optional db schema, string
+            :param unique_keys: optional list of lists of column names,
+                natural keys of the table
+            :param indexes: optional list of composite indexes, dicts with
+                columns (list of column names), unique and name (optional)
             :return: sqlalchemy model
         """
 
-        try:
-            old = self.session.query(DTable).filter_by(
-                collection=collection, name=name, schema=schema).one()
-        except:
-            # not found: ok
-            pass
-        else:
-            raise TableExistException('table %s already defined' % name)
-
-        table = DTable(collection=collection, name=name, schema=schema)
-        self.session.add(table)
-        many_relations = []
-        if columns:
-            for col_attrs in columns:
-                dcol = DColumn(**col_attrs)
-                dcol.validate()
-                table.columns.append(dcol)
-                if dcol.is_many_relationship():
-                    many_relations.append(dcol)
-        self.session.commit()
-
-        klass = table.to_sa(self)
-        klass.__table__.create(bind=self.session.get_bind())
-
-        # secondary tables and attributes must be created afterwards
-        for mrel in many_relations:
-            self._add_relation_table(mrel)
-            setattr(klass, dcol.name, dcol.get_many_relationship(self))
-        return klass
+        return self.add_many([dict(
+            collection=collection, name=name, columns=columns,
+            schema=schema, unique_keys=unique_keys, indexes=indexes)])[0]
 
     def add_from_config(self, config):
         """ Utility to add from parameters passed in a dict
             :param config: dict containing at least collection,
                 name and columns keys
         """
-        for key in ('collection', 'name'):
-            assert key in config, 'missing config "{}"'.format(key)
-        return self.add(
-            config['collection'], config['name'],
-            columns=config.get('columns', []),
-            schema=config.get('schema', None))
+        return self.add_many([config])[0]
+
+    @_serialized
+    def add_many(self, configs):
+        """ Add several tables at once:
+            - validate all definitions
+            - insert definitions in DTable & DColumn, secondary tables of
+              many relations included, in one transaction
+            - Create all sql tables with a single create_all
+            - Create sqlalchemy models with relationships
+
+            Tables may reference each other, in any order.
+
+            :param configs: list of dict as accepted by add_from_config
+            :return: list of sqlalchemy models, in configs order
+        """
+
+        new = OrderedDict()
+        for config in configs:
+            for key in ('collection', 'name'):
+                if key not in config:
+                    raise InvalidDefinitionException(
+                        'missing config "{}"'.format(key))
+            self._new_table(
+                new, config['collection'], config['name'],
+                config.get('columns') or [], config.get('schema'),
+                config.get('unique_keys'), config.get('indexes'))
+
+        many_relations = []
+        for table in list(new.values()):
+            for col in table.columns:
+                if col.is_many_relationship():
+                    many_relations.append(col)
+                    self._new_table(new, **self._relation_table_config(col))
+        for table in new.values():
+            for col in table.columns:
+                self._check_target(col, new)
+
+        generation = self._bump_generation()
+        for table in new.values():
+            table.generation = generation
+            for col in table.columns:
+                col.generation = generation
+            self.session.add(table)
+        try:
+            self.session.flush()
+        except IntegrityError:
+            # deprecated tables keep their name
+            self.session.rollback()
+            raise TableExistException('table already defined in %s' % (
+                ', '.join(name for _, name in new)))
+
+        tables = self._sort_tables(list(new.values()))
+        klasses = {}
+        try:
+            with self._build_lock:
+                self._build_new(tables, many_relations, klasses)
+            with self._measure('ddl'):
+                self._base.metadata.create_all(
+                    self.session.connection(),
+                    tables=[klass.__table__ for klass in klasses.values()],
+                    checkfirst=False)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            for table in tables:
+                self._discard(table)
+            raise
+
+        if self.max_models is not None:
+            self._shrink()
+        return [klasses[key] for key in list(new)[:len(configs)]]
+
+    def _build_new(self, tables, many_relations, klasses):
+        """ Register and build the models of add_many, in klasses
+            The caller holds the build lock. Classes are published before
+            their many relations are set: they are marked as being built
+            so that get waits for them
+        """
+
+        keys = [(table.collection, table.name) for table in tables]
+        self._building.update(keys)
+        try:
+            for table in tables:
+                self._register(table)
+                with self._measure('model_build'):
+                    klass = table.to_sa(self)
+                self._track(table, klass, shrink=False)
+                klasses[(table.collection, table.name)] = klass
+            # secondary tables and attributes must be created afterwards
+            for col in many_relations:
+                setattr(klasses[(col.table.collection, col.table.name)],
+                        col.name, self._many_relationship(col))
+        finally:
+            self._building.difference_update(keys)
+
+    def _new_table(self, new, collection, name, columns, schema=None,
+                   unique_keys=None, indexes=None):
+        """ Validated DTable for add_many, indexed in new """
+
+        if name in self._collections.get(collection, {}) or \
+                (collection, name) in new:
+            raise TableExistException('table %s already defined' % name)
+
+        table = DTable(collection=collection, name=name, schema=schema,
+                       unique_keys=unique_keys, indexes=indexes)
+        for col_attrs in columns:
+            dcol = DColumn(**col_attrs)
+            dcol.validate()
+            table.columns.append(dcol)
+        table.validate()
+        new[(collection, name)] = table
+        return table
+
+    def _check_target(self, dcol, new=None):
+        """ Ensure the target of a relation is defined """
+
+        if not dcol.is_relationship() or dcol.relation.external:
+            return
+        collection = dcol.relation.collection
+        name = dcol.relation.name
+        if name not in self._collections.get(collection, {}) and \
+                (collection, name) not in (new or {}):
+            raise InvalidDefinitionException(
+                'unknown relation target %s.%s' % (collection, name))
 
     def add_column(self, collection, name, attrs):
         """ Add a column to an existing table:
@@ -94,36 +407,439 @@ class Registry(object):
             - append the attribute to the base class
         """
 
-        # register in db
+        self.add_columns(collection, name, [attrs])
+
+    @_serialized
+    def add_columns(self, collection, name, columns):
+        """ Add several columns to an existing table:
+            - insert them in db (DColumn) in one transaction
+            - alter the dynamic table in the same transaction, with a single
+              statement when the dialect accepts several ADD clauses
+            - append the attributes to the base class
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param columns: list of dictionaries of columns definitions
+            :return: None
+        """
+
         klass = self.get(collection, name)
-        col = DColumn(table_id=klass.ID, **attrs)
-        col.validate()
-        self.session.add(col)
-        self.session.commit()
+        table = self._get_dtable(collection, name)
+        names = set(col.name for col in table.get_columns())
+        cols = []
+        for attrs in columns:
+            col = DColumn(table_id=table.id, **attrs)
+            col.validate()
+            self._check_target(col)
+            if col.name in names:
+                raise InvalidDefinitionException(
+                    'column %s already defined' % col.name)
+            names.add(col.name)
+            cols.append(col)
 
-        if col.is_many_relationship():
-            self._add_relation_table(col)
-        else:
-            # alter table
-            sql = 'alter table %s add %s' % (
-                col.table.get_name(),
-                CreateColumn(col.to_sa()).compile(self.session.get_bind()))
-            con = self.session.get_bind().connect()
-            con.execute(sql)
+        generation = self._bump_generation()
+        for col in cols:
+            col.generation = generation
+        self.session.add_all(cols)
+        try:
+            self.session.flush()
+            con = self.session.connection()
+            added = [col for col in cols if not col.is_many_relationship()]
+            for sql in self._alter_statements(klass.__table__, added):
+                with self._measure('ddl'):
+                    con.execute(sql)
+            # indexes of the new columns, on a copy of the table
+            copy = Table(klass.__table__.name, MetaData(),
+                         *[col.to_sa() for col in added],
+                         schema=klass.__table__.schema)
+            for index in copy.indexes:
+                with self._measure('ddl'):
+                    index.create(con)
+            for col in cols:
+                self._register_column(table, col)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            set_committed_value(table, 'columns', [
+                col for col in table.columns if col not in cols])
+            raise
+
+        many_relations = [col for col in cols if col.is_many_relationship()]
+        if many_relations:
+            self.add_many([
+                self._relation_table_config(col) for col in many_relations])
+
+        with self._build_lock:
+            self._add_attributes(klass, cols)
+
+    def _add_attributes(self, klass, cols):
+        """ Append the attributes of new DColumns to a mapped class """
+
+        for col in cols:
+            if col.is_parent_relationship():
+                setattr(klass, col.get_name(), col.get_property(self))
+                setattr(klass, col.name, col.get_parent_relationship(self))
+            elif col.is_many_relationship():
+                setattr(klass, col.name, self._many_relationship(col))
+            else:
+                setattr(klass, col.get_name(), col.get_property(self))
+
+    @_serialized
+    def add_index(self, collection, name, columns, unique=False,
+                  index_name=None):
+        """ Add a composite index to an existing table:
+            - record it in DTable
+            - create it in db
+            - append it to the sqlalchemy table
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param columns: list of column names
+            :param unique: True for a unique index
+            :param index_name: optional index name
+            :return: None
+        """
+
+        klass = self.get(collection, name)
+        table = self._get_dtable(collection, name)
+        if not columns or not set(columns).issubset(table._get_sa_names()):
+            raise InvalidDefinitionException(
+                'table %s: invalid index %s' % (name, columns))
+        index = dict(columns=list(columns), unique=unique)
+        if index_name:
+            index['name'] = index_name
+        previous = table.indexes
+
+        generation = self._bump_generation()
+        # read again, locked: another process may have added an index
+        # since this one loaded the catalog
+        indexes = self.session.query(DTable.indexes).filter_by(
+            id=table.id).with_for_update().scalar()
+        indexes = list(indexes or []) + [index]
+        self.session.query(DTable).filter_by(id=table.id).update(
+            {'indexes': indexes, 'generation': generation},
+            synchronize_session=False)
+        set_committed_value(table, 'indexes', indexes)
+        index_name, colnames, unique = table.get_indexes()[-1]
+        sa_index = Index(index_name, *[klass.__table__.c[colname]
+                                       for colname in colnames],
+                         unique=unique)
+        try:
+            with self._measure('ddl'):
+                sa_index.create(self.session.connection())
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            set_committed_value(table, 'indexes', previous)
+            klass.__table__.indexes.discard(sa_index)
+            raise
+        set_committed_value(table, 'generation', generation)
+        self._add_indexes(klass, table)
+
+    @staticmethod
+    def _add_indexes(klass, table):
+        """ Append the indexes of a DTable missing from the sqlalchemy
+            table of klass, they already exist in db
+        """
+
+        sa_table = klass.__table__
+        names = set(index.name for index in sa_table.indexes)
+        for index_name, colnames, unique in table.get_indexes():
+            if index_name not in names:
+                Index(index_name, *[sa_table.c[colname]
+                                    for colname in colnames],
+                      unique=unique)
+
+    def backfill(self, collection, name, colname, value=None, checkpoint=0,
+                 **kwargs):
+        """ Fill NULL values of an existing column, by ranges of ids
+            See backfill.Backfill for the options
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param colname: column name - String
+            :param value: optional callable computing the value from a row,
+                default of the column if None
+            :param checkpoint: last id already processed, to resume
+            :return: number of rows updated
+        """
+
+        return Backfill(self, collection, name, colname, value=value,
+                        **kwargs).run(checkpoint)
+
+    def bulk_insert(self, collection, name, rows, chunk_size=1000):
+        """ Insert rows with executemany, without building ORM objects
+            Values are converted according to the column kinds. Rows are
+            consumed chunk by chunk, each chunk in its own transaction.
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param rows: iterable of dicts, keys are column names
+                (name__id for parent relations)
+            :param chunk_size: number of rows per executemany
+            :return: list of the number of rows inserted by each chunk
+        """
+
+        return self._write_chunks(
+            collection, name, rows, chunk_size,
+            lambda con, table, params: con.execute(table.insert(), params))
+
+    def bulk_upsert(self, collection, name, rows, key, chunk_size=1000):
+        """ Insert rows, update the ones whose key already exists
+            Uses INSERT ... ON CONFLICT on PostgreSQL and SQLite, a select
+            of the existing keys followed by batched updates and inserts
+            elsewhere. Values are converted as in bulk_insert; existing
+            rows get the columns present in the chunk updated.
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param rows: iterable of dicts, keys are column names
+            :param key: list of column names, a unique key of the table
+                (see add), a column defined unique or ['id']
+            :param chunk_size: number of rows per statement
+            :return: list of the number of rows written by each chunk
+        """
+
+        dtable = self._get_dtable(collection, name)
+        names = dict((col.name, col.get_name()) for col in dtable.get_columns())
+        names['id'] = 'id'
+        try:
+            key = tuple(names[colname] for colname in key)
+        except KeyError as exc:
+            raise InvalidDefinitionException('unknown column %s' % exc)
+        uniques = [set(k) for k in dtable.get_unique_keys()] + [{'id'}] + [
+            {col.get_name()} for col in dtable.get_columns() if col.unique]
+        if set(key) not in uniques:
+            raise InvalidDefinitionException(
+                'no unique key on %s' % ', '.join(key))
+
+        def write(con, table, params):
+            missing = set(key).difference(params[0])
+            if missing:
+                raise KeyError('missing key %s' % ', '.join(sorted(missing)))
+            upsert(con, table, key, params)
+        return self._write_chunks(collection, name, rows, chunk_size, write)
+
+    def export(self, collection, name, fmt, fileobj, batch_size=1000):
+        """ Stream all rows of a table to a file, without ORM objects
+            See export module for the formats
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param fmt: 'csv' or 'jsonl'
+            :param fileobj: text file
+            :param batch_size: number of rows fetched at a time
+            :return: number of rows written
+        """
+
+        table = self.get(collection, name).__table__
+        con = self.session.get_bind().connect()
+        try:
+            return table_export.export(
+                con, self._get_dtable(collection, name), table, fmt, fileobj,
+                batch_size)
+        finally:
             con.close()
 
-        if col.is_parent_relationship():
-            setattr(klass, col.get_name(), col.to_sa())
-            setattr(klass, col.name, col.get_parent_relationship(self))
-            # getattr(klass, col.name).property.init()
+    def import_rows(self, collection, name, fmt, fileobj, chunk_size=1000):
+        """ Stream rows of a file written by export into a table
+            through bulk_insert
 
-        elif col.is_many_relationship():
-            setattr(klass, col.name, col.get_many_relationship(self))
-        else:
-            setattr(klass, col.get_name(), col.to_sa())
+            :param collection: collection name - String
+            :param name: table name - String
+            :param fmt: 'csv' or 'jsonl'
+            :param fileobj: text file
+            :param chunk_size: number of rows per executemany
+            :return: list of the number of rows inserted by each chunk
+        """
+
+        rows = table_export.read(
+            self._get_dtable(collection, name), fmt, fileobj)
+        return self.bulk_insert(collection, name, rows, chunk_size)
+
+    def validator(self, collection, name):
+        """ Validator and coercer of the rows of a table, compiled from
+            its columns and cached until its definition changes
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :return: dynalchemy.validation.RowValidator
+        """
+
+        return self._compile(RowValidator, collection, name)
+
+    def serializer(self, collection, name, fields=None):
+        """ Serializer of the rows of a table to dicts and json, compiled
+            from its columns and cached until its definition changes
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param fields: optional list of column names, id is always
+                serialized. By default, all columns but the deferred ones
+            :return: dynalchemy.serializers.RowSerializer
+        """
+
+        if fields is not None:
+            fields = tuple(fields)
+        return self._compile(RowSerializer, collection, name, fields, self)
+
+    def paginator(self, collection, name, order_by=None):
+        """ Keyset paginator of a table, see dynalchemy.pagination
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param order_by: optional list of column names, the leading
+                columns of an index of the table; id is appended to break
+                ties. Rows are ordered by id by default.
+            :return: Paginator, with page(token, page_size, query) and
+                batches(batch_size, query)
+        """
+
+        return Paginator(self.session, self.get(collection, name),
+                         self._get_dtable(collection, name), order_by)
+
+    def paginate(self, collection, name, token=None, page_size=100,
+                 order_by=None, query=None):
+        """ One page of a table, selected after the position of token
+            rather than with an offset
+
+            :param token: next_token of the previous page, None first
+            :param page_size: number of rows
+            :param order_by: see paginator
+            :param query: optional unordered query of the model
+            :return: Page, items and next_token (None on the last page)
+        """
+
+        return self.paginator(collection, name, order_by).page(
+            token, page_size, query)
+
+    def iterate(self, collection, name, batch_size=1000, order_by=None,
+                query=None):
+        """ Generator walking a whole table in keyset batches, for
+            background jobs: every batch costs the same
+
+            :return: iterator of lists of rows
+        """
 
-    def _add_relation_table(self, dcol):
-        """ Create secondary table in db """
+        return self.paginator(collection, name, order_by).batches(
+            batch_size, query)
+
+    def _compile(self, factory, collection, name, *args):
+        """ factory(dtable, *args), cached by args until the table
+            definition changes
+        """
+
+        compiled = self._compiled.get((collection, name))
+        if compiled is None:
+            compiled = self._compiled.setdefault((collection, name), {})
+        key = (factory,) + args
+        obj = compiled.get(key)
+        if obj is None:
+            obj = compiled[key] = factory(
+                self._get_dtable(collection, name), *args)
+        return obj
+
+    def read_columns(self, collection, name, columns, where=None,
+                     chunk_size=10000):
+        """ Read columns of a table into numpy arrays, without ORM objects
+            dtypes follow the column kinds (int64, float64, bool,
+            datetime64), object for the others. Requires numpy.
+
+            :param collection: collection name - String
+            :param name: table name - String
+            :param columns: list of column names, id included
+            :param where: optional sqlalchemy clause, for instance
+                Model.nb_wings > 2
+            :param chunk_size: number of rows fetched at a time
+            :return: dict of arrays by column name, masked arrays for
+                nullable columns
+        """
+
+        table = self.get(collection, name).__table__
+        con = self.session.get_bind().connect()
+        try:
+            return columnar.read_columns(
+                con, self._get_dtable(collection, name), table, columns,
+                where, chunk_size)
+        finally:
+            con.close()
+
+    def _write_chunks(self, collection, name, rows, chunk_size, write):
+        """ Convert rows chunk by chunk and pass them to write, each chunk
+            in its own transaction
+
+            :param write: callable(connection, table, list of dicts)
+            :return: list of the number of rows of each chunk
+        """
+
+        table = self.get(collection, name).__table__
+        coercers, defaults = self._row_converters(collection, name)
+        rows = iter(rows)
+        counts = []
+        con = self.session.get_bind().connect()
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                params = self._coerce_rows(chunk, coercers, defaults)
+                with con.begin():
+                    write(con, table, params)
+                counts.append(len(params))
+        finally:
+            con.close()
+        return counts
+
+    def _row_converters(self, collection, name):
+        """ conversion functions and defaults of a table, by column name """
+
+        coercers = {'id': to_int}
+        defaults = {}
+        for col in self._get_dtable(collection, name).get_columns():
+            if col.is_many_relationship():
+                continue
+            coercers[col.get_name()] = coercer(col)
+            if col.default is not None:
+                defaults[col.get_name()] = col._get_default()
+        return coercers, defaults
+
+    @staticmethod
+    def _coerce_rows(rows, coercers, defaults):
+        """ Convert a chunk of rows: all rows get the same keys, missing
+            values are the column default or None
+        """
+
+        keys = set()
+        for row in rows:
+            keys.update(row)
+        unknown = keys.difference(coercers)
+        if unknown:
+            raise KeyError('unknown columns %s' % ', '.join(sorted(unknown)))
+
+        converters = [(key, coercers[key], defaults.get(key)) for key in keys]
+        params = []
+        for row in rows:
+            params.append(dict(
+                (key, convert(row[key]) if key in row else default)
+                for key, convert, default in converters))
+        return params
+
+    def _alter_statements(self, sa_table, cols):
+        """ alter table statements adding DColumns cols to sa_table """
+
+        bind = self.session.get_bind()
+        name = bind.dialect.identifier_preparer.format_table(sa_table)
+        specs = [CreateColumn(col.to_sa()).compile(bind) for col in cols]
+        if not specs:
+            return []
+        if bind.dialect.name in ('postgresql', 'mysql'):
+            return ['alter table %s %s' % (
+                name, ', '.join('add %s' % spec for spec in specs))]
+        return ['alter table %s add %s' % (name, spec) for spec in specs]
+
+    @staticmethod
+    def _relation_table_config(dcol):
+        """ Definition of the secondary table of a many relation """
 
         columns = [
             dict(
@@ -135,22 +851,26 @@ class Registry(object):
                     'cardinality': 'one'}
             ),
             dict(
-                name=dcol.relation['name'],
+                name=dcol.relation.name,
                 kind='Relation',
                 relation={
-                    'collection': dcol.relation['collection'],
-                    'name': dcol.relation['name'],
+                    'collection': dcol.relation.collection,
+                    'name': dcol.relation.name,
                     'cardinality': 'one'}
             )
         ]
+        return dict(collection=dcol.table.collection,
+                    name=dcol.get_secondary_tablename(),
+                    columns=columns)
 
-        self.add(dcol.table.collection, dcol.get_secondary_tablename(),
-                 columns=columns)
-
+    @_serialized
     def deprecate_column(self, collection, name, colname):
         """ Mark column colname as deprecated
             Data are not removed from database
-            Class definition is updated in the db
+            Class definition is updated in the db. The model is not
+            rebuilt: its backrefs are already declared on the models it
+            references. The attribute stays mapped in running processes
+            and is gone from the models built afterwards.
 
             :param collection: collection name - String
             :param name: table name - String
@@ -158,24 +878,76 @@ class Registry(object):
             :return: None
         """
 
-        col = self.session.query(DColumn).join(DTable)\
-            .filter(DTable.collection == collection)\
-            .filter(DTable.name == name)\
-            .filter(DColumn.name == colname).one()
-        col.active = False
+        table = self._get_dtable(collection, name)
+        try:
+            col = [c for c in table.get_columns() if c.name == colname][0]
+        except IndexError:
+            raise NoResultFound('column %s not found' % colname)
+        generation = self._bump_generation()
+        self.session.query(DColumn).filter_by(id=col.id).update(
+            {'active': False, 'generation': generation},
+            synchronize_session=False)
         self.session.commit()
+        set_committed_value(col, 'active', False)
+        set_committed_value(col, 'generation', generation)
+        self._compiled.pop((collection, name), None)
 
-        # remove from declarative registry
-        del self._base._decl_class_registry[col.table.get_name()]
-        self._reload(collection, name)
+    def _get_dtable(self, collection, name):
+        """ active dtable from the catalog, selected in db if unknown """
 
+        try:
+            return self._collections[collection][name]
+        except KeyError:
+            pass
+        with self._catalog_session() as session, \
+                self._measure('catalog_query'):
+            table = session.query(DTable).filter_by(
+                collection=collection, name=name, active=True).one()
+            self._register(table)
+        return table
 
-    def _get_dtable(self, collection, name):
-        """ select dtable in db """
+    def _register(self, table):
+        """ Index a DTable and its columns in the catalog
+            They are detached from the session: commits do not expire them
+        """
+
+        columns = list(table.columns)
+        self._detach([table] + columns)
+        for col in columns:
+            set_committed_value(col, 'table', table)
+        self._compiled.pop((table.collection, table.name), None)
+        # copied on write: readers iterate a collection without locking
+        names = OrderedDict(self._collections.get(table.collection, ()))
+        names[table.name] = table
+        self._collections[table.collection] = names
+
+    def _detach(self, objs):
+        """ Expunge catalog objects from their session """
+
+        for obj in objs:
+            session = object_session(obj)
+            if session is not None:
+                session.expunge(obj)
 
-        return self.session.query(DTable).filter_by(
-            collection=collection, name=name, active=True).one()
+    def _register_column(self, table, col):
+        """ Append a flushed DColumn to a DTable of the catalog """
 
+        self.session.expunge(col)
+        set_committed_value(table, 'columns', list(table.columns) + [col])
+        set_committed_value(col, 'table', table)
+        self._compiled.pop((table.collection, table.name), None)
+
+    def _unregister(self, table):
+        """ Remove a DTable from the catalog """
+
+        self._compiled.pop((table.collection, table.name), None)
+        names = self._collections.get(table.collection, {})
+        if table.name in names:
+            names = OrderedDict(names)
+            del names[table.name]
+            self._collections[table.collection] = names
+
+    @_serialized
     def deprecate(self, collection, name):
         """ Mark table as deprecated
             Data are not removed from database
@@ -187,13 +959,90 @@ class Registry(object):
         """
 
         table = self._get_dtable(collection, name)
-        table.active = False
+        generation = self._bump_generation()
+        self.session.query(DTable).filter_by(id=table.id).update(
+            {'active': False, 'generation': generation},
+            synchronize_session=False)
         self.session.commit()
-        self._base.metadata.remove(table)
-        try:
-            del self._base._decl_class_registry[table.get_name()]
-        except:
-            pass
+        set_committed_value(table, 'active', False)
+        set_committed_value(table, 'generation', generation)
+        with self._build_lock:
+            self._discard(table)
+
+    def _discard(self, table):
+        """ Remove a deprecated table from the catalog and the metadata """
+
+        self._unregister(table)
+        self._untrack((table.collection, table.name))
+        klass = self._base._decl_class_registry.pop(table.get_name(), None)
+        if klass is not None:
+            self._base.metadata.remove(klass.__table__)
+
+    def refresh(self):
+        """ Apply catalog changes committed since the last load or refresh,
+            by this process or another one sharing the database.
+            Only one query is issued when nothing changed, without waiting
+            for the catalog changes in progress in other threads.
+
+            :return: list of (collection, name) of the updated tables
+        """
+
+        if self._current_generation() <= self.generation:
+            return []
+        return self._refresh()
+
+    @_serialized
+    def _refresh(self):
+        """ refresh, once the catalog changed """
+
+        generation = self._current_generation()
+        if generation <= self.generation:
+            return []
+
+        table_ids = union(
+            select([DTable.id]).where(DTable.generation > self.generation),
+            select([DColumn.table_id]).where(
+                DColumn.generation > self.generation))
+        tables = self._query_catalog(table_ids)
+        self.generation = generation
+
+        updated = []
+        for table in tables:
+            current = self._collections.get(table.collection, {})\
+                .get(table.name)
+            if table.active and current is not None and \
+                    current.id == table.id and \
+                    current.generation == table.generation and \
+                    [c.id for c in current.get_columns()] == \
+                    [c.id for c in table.get_columns()]:
+                # already applied in this process
+                self._detach([table] + list(table.columns))
+                continue
+
+            updated.append((table.collection, table.name))
+            with self._build_lock:
+                if not table.active:
+                    self._detach([table] + list(table.columns))
+                    if current is not None:
+                        self._discard(current)
+                    continue
+
+                klass = self._base._decl_class_registry.get(table.get_name())
+                if current is not None:
+                    self._unregister(current)
+                self._register(table)
+                if klass is not None and current is not None:
+                    # patched rather than rebuilt, as in add_columns:
+                    # a new class would declare its backrefs again
+                    known = set(col.id for col in current.get_columns())
+                    self._add_attributes(klass, [
+                        col for col in table.get_columns()
+                        if col.id not in known])
+                    self._add_indexes(klass, table)
+                    self._track(table, klass)
+                elif klass is None and not self.lazy:
+                    self._build(table)
+        return updated
 
     def get(self, collection, name):
         """ Retrieve one mapped sqlalchemy class
@@ -204,20 +1053,143 @@ class Registry(object):
         """
 
         key = '%s__%s' % (collection, name)
+        klass = self._base._decl_class_registry.get(key)
+        if klass is None or (collection, name) in self._building:
+            # lazy mode, evicted, models stored as weakrefs have been
+            # discarded, or being built by another thread
+            with self._build_lock:
+                klass = self._base._decl_class_registry.get(key)
+                if klass is None:
+                    self._count('get_miss')
+                    return self._build(self._get_dtable(collection, name))
+        self._count('get_hit')
+        if self.max_models is not None:
+            with self._lru_lock:
+                if (collection, name) in self._resident:
+                    self._resident.move_to_end((collection, name))
+        return klass
+
+    def _build(self, table):
+        """ Create the mapped class of a DTable, with its many relations
+            The caller holds the build lock. Targets of the relations are
+            built in nested calls: models are only evicted once the
+            outermost one is done and links them.
+        """
+
+        key = (table.collection, table.name)
+        self._building.add(key)
         try:
-            return self._base._decl_class_registry[key]
-        except KeyError:
-            # models are stored as weakrefs: they have been discard
-            return self._reload(collection, name)
+            with self._measure('model_build'):
+                klass = table.to_sa(self)
+            # the sqlalchemy table may be left from an earlier build
+            self._add_indexes(klass, table)
+            self._track(table, klass, shrink=False)
+            for col in table.get_columns():
+                if col.is_many_relationship():
+                    setattr(klass, col.name, self._many_relationship(col))
+        finally:
+            self._building.discard(key)
+        if not self._building and self.max_models is not None:
+            self._shrink(keep=key)
+        return klass
 
-    def _reload(self, collection, name):
+    def _track(self, table, klass, shrink=True):
+        """ Record a model built from table as the most recently used """
 
-        table = self._get_dtable(collection, name)
-        klass = table.to_sa(self)
-        for col in table.columns:
+        if self.max_models is None:
+            return
+        key = (table.collection, table.name)
+        with self._lru_lock:
+            self._track_links(table, klass, key)
+            if shrink:
+                self._shrink(keep=key)
+
+    def _track_links(self, table, klass, key):
+        """ Record klass as resident with the models it is linked to """
+
+        self._untrack(key)
+        links = set()
+        for col in table.get_columns():
+            if not col.is_relationship():
+                continue
+            if col.relation.external:
+                # the external class holds a backref: never evicted
+                links.add(None)
+                continue
+            links.add((col.relation.collection, col.relation.name))
             if col.is_many_relationship():
-                setattr(klass, col.name, col.get_many_relationship(self))
-        return klass
+                links.add((table.collection, col.get_secondary_tablename()))
+        links.discard(key)
+
+        self._resident[key] = klass
+        self._links[key] = links
+        for link in links:
+            self._referrers.setdefault(link, set()).add(key)
+
+    def _untrack(self, key):
+        """ Forget a resident model """
+
+        with self._lru_lock:
+            if self._resident.pop(key, None) is None:
+                return
+            for link in self._links.pop(key):
+                self._referrers[link].discard(key)
+
+    def _shrink(self, keep=None):
+        """ Evict least recently used models above max_models
+            Models linked by relations form a group evicted as a whole,
+            dated by its most recently used model. Never while a model is
+            being built: its targets are not linked to it yet
+        """
+
+        with self._build_lock, self._lru_lock:
+            excess = len(self._resident) - self.max_models
+            if excess <= 0:
+                return
+            order = dict((key, i) for i, key in enumerate(self._resident))
+            groups = []
+            for key in self._resident:
+                if not any(key in group for group in groups):
+                    groups.append(self._group(key))
+            groups.sort(key=lambda group: max(order[key] for key in group))
+            for group in groups:
+                if excess <= 0:
+                    break
+                if keep in group or \
+                        any(None in self._links[key] for key in group):
+                    continue
+                excess -= len(group)
+                while group:
+                    # referrers first: they hold the backrefs of targets
+                    key = min((key for key in group
+                               if not self._referrers.get(key)),
+                              default=min(group))
+                    group.discard(key)
+                    self._evict(key)
+
+    def _group(self, key):
+        """ Set of the resident models linked to key, directly or not """
+
+        group = set([key])
+        todo = [key]
+        while todo:
+            key = todo.pop()
+            for other in self._links[key] | self._referrers.get(key, set()):
+                if other in self._resident and other not in group:
+                    group.add(other)
+                    todo.append(other)
+        return group
+
+    def _evict(self, key):
+        """ Dispose of a resident model: mapper, table and class """
+
+        klass = self._resident[key]
+        self._untrack(key)
+        name = klass.__tablename__
+        if self._base._decl_class_registry.get(name) is klass:
+            del self._base._decl_class_registry[name]
+        self._base.metadata.remove(klass.__table__)
+        klass.__mapper__.dispose()
 
     def list(self, collection):
         """ Retrieve a collection of tables
@@ -226,14 +1198,114 @@ class Registry(object):
             :return: list of sqlalchemy table classes
         """
 
-        all_tables = self.session.query(DTable).filter_by(
-            collection=collection, active=True).all()
-        return [self.get(collection, dtable.name) for dtable in all_tables]
+        names = list(self._collections.get(collection, ()))
+        return [self.get(collection, name) for name in names]
 
     def _load_all(self):
+        """ Build all active models at startup """
 
-        for table in self.session.query(DTable).all():
-            klass = table.to_sa(self)
-            for col in table.columns:
+        tables = self._sort_tables(self._index_all())
+        klasses = []
+        for table in tables:
+            with self._measure('model_build'):
+                klass = table.to_sa(self)
+            self._track(table, klass, shrink=False)
+            klasses.append(klass)
+        # secondary tables all exist now
+        for table, klass in zip(tables, klasses):
+            for col in table.get_columns():
                 if col.is_many_relationship():
-                    setattr(klass, col.name, col.get_many_relationship(self))
+                    setattr(klass, col.name, self._many_relationship(col))
+        if self.max_models is not None:
+            self._shrink()
+
+    def _index_all(self):
+        """ Index active definitions in the catalog """
+
+        tables = self._load_catalog()
+        for table in tables:
+            self._register(table)
+        return tables
+
+    def _load_catalog(self):
+        """ Active tables from the snapshot if it is still valid,
+            from the database otherwise
+
+            :return: list of DTable, columns collections already populated
+        """
+
+        if not self.snapshot:
+            # generation read first: later changes are caught by refresh
+            self.generation = self._current_generation()
+            return self._query_catalog()
+
+        with self._measure('catalog_query'):
+            fprint = catalog_snapshot.fingerprint(self.session)
+        self.generation = fprint[0]
+        tables = catalog_snapshot.load(self.snapshot, fprint)
+        if tables is not None:
+            return tables
+
+        tables = self._query_catalog()
+        catalog_snapshot.dump(
+            self.snapshot, fprint, self._sort_tables(tables))
+        return tables
+
+    def _query_catalog(self, table_ids=None):
+        """ Fetch active tables and their active columns in two queries
+
+            :param table_ids: optional selectable restricting the tables,
+                deprecated ones included
+            :return: list of DTable, columns collections already populated
+        """
+
+        with self._catalog_session() as session, \
+                self._measure('catalog_query'):
+            tables = session.query(DTable)
+            if table_ids is None:
+                tables = tables.filter_by(active=True)
+            else:
+                tables = tables.filter(DTable.id.in_(table_ids))
+            tables = tables.order_by(DTable.id).all()
+            columns = dict((table.id, []) for table in tables)
+            query = session.query(DColumn).join(DTable)\
+                .filter(DTable.active == True)\
+                .filter(DColumn.active == True)\
+                .order_by(DColumn.id)
+            if table_ids is not None:
+                query = query.filter(DTable.id.in_(table_ids))
+            for col in query:
+                columns[col.table_id].append(col)
+
+        for table in tables:
+            set_committed_value(table, 'columns', columns[table.id])
+            for col in columns[table.id]:
+                set_committed_value(col, 'table', table)
+        return tables
+
+    @staticmethod
+    def _sort_tables(tables):
+        """ Order tables so that relation targets come before the tables
+            referencing them. Unknown targets are ignored.
+        """
+
+        by_key = dict(((t.collection, t.name), t) for t in tables)
+        ordered = []
+        seen = set()
+        for table in tables:
+            if id(table) in seen:
+                continue
+            stack = [(table, iter(table.get_dependencies()))]
+            seen.add(id(table))
+            while stack:
+                current, deps = stack[-1]
+                for key in deps:
+                    dep = by_key.get(key)
+                    if dep is not None and id(dep) not in seen:
+                        seen.add(id(dep))
+                        stack.append((dep, iter(dep.get_dependencies())))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(current)
+        return ordered
@@ -0,0 +1,110 @@
+""" Migrations of the catalog tables
+
+Registry runs them when it upgrades the catalog tables of an older
+version. They may also be run by hand on a connection.
+"""
+
+import pickle
+
+from sqlalchemy import (Column, Integer, MetaData, Table, bindparam,
+                        column, inspect, select)
+from sqlalchemy.orm import Session
+
+from .models import DColumn, DTable, Relation
+
+# catalog fields formerly stored with PickleType
+PICKLED = (
+    (DTable, ('unique_keys', 'indexes')),
+    (DColumn, ('choices', 'relation')),
+)
+
+# first byte of the pickles written by PickleType (protocol >= 2)
+PICKLE_PREFIX = b'\x80'
+
+# marks values left as they are
+_UNCHANGED = object()
+
+
+def pickle_to_json(con):
+    """ Rewrite the pickled catalog fields in json and fill the relation
+        target columns. Values already in json are left untouched.
+
+        :param con: sqlalchemy connection, in a transaction
+        :return: number of rows rewritten
+    """
+
+    count = 0
+    for model, keys in PICKLED:
+        table = model.__table__
+        # untyped columns: raw values, not decoded by JSONType
+        query = select([table.c.id] + [column(key) for key in keys])\
+            .select_from(table)
+        updates = []
+        for row in con.execute(query).fetchall():
+            values = dict((key, _unpickle(row[key])) for key in keys)
+            values = dict((key, value) for key, value in values.items()
+                          if value is not _UNCHANGED)
+            if not values:
+                continue
+            if values.get('relation') is not None:
+                relation = Relation.from_dict(values['relation'])
+                values['target_collection'] = relation.collection
+                values['target_name'] = relation.name
+            values['_id'] = row['id']
+            updates.append(values)
+
+        for values in updates:
+            con.execute(
+                table.update().where(table.c.id == bindparam('_id'))
+                .values(dict((key, bindparam(key))
+                             for key in values if key != '_id')),
+                values)
+        count += len(updates)
+    return count
+
+
+def index_foreign_keys(con):
+    """ Create the indexes of the parent relation columns (name__id),
+        association tables included, of the dynamic tables created before
+        these columns were indexed. Existing indexes are left untouched.
+
+        :param con: sqlalchemy connection, in a transaction
+        :return: number of indexes created
+    """
+
+    session = Session(bind=con)
+    try:
+        cols = session.query(DColumn).join(DTable)\
+            .filter(DTable.active == True)\
+            .filter(DColumn.active == True)\
+            .filter(DColumn.kind == 'Relation')\
+            .order_by(DColumn.id).all()
+        inspector = inspect(con)
+        count = 0
+        for col in cols:
+            if not col.is_parent_relationship():
+                continue
+            table = col.table
+            if any(index['column_names'] == [col.get_name()]
+                   for index in inspector.get_indexes(
+                       table.get_name(), schema=table.schema)):
+                continue
+            # same name as the index declared by the model
+            sa_table = Table(table.get_name(), MetaData(),
+                             Column(col.get_name(), Integer, index=True),
+                             schema=table.schema)
+            for index in sa_table.indexes:
+                index.create(con)
+            count += 1
+    finally:
+        session.close()
+    return count
+
+
+def _unpickle(value):
+    if value is None:
+        return _UNCHANGED
+    value = bytes(value)
+    if not value.startswith(PICKLE_PREFIX):
+        return _UNCHANGED
+    return pickle.loads(value)
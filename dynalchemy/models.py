@@ -1,16 +1,114 @@
 
+import json
+from collections import namedtuple
+
 import sqlalchemy
 
 from sqlalchemy import Column, Integer, ForeignKey, String
-from sqlalchemy import Boolean, PickleType, UniqueConstraint
+from sqlalchemy import Boolean, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, deferred, validates
+from sqlalchemy.schema import conv
+from sqlalchemy.types import TypeDecorator
+
+from .types import CODECS, TYPES
 
 # this Base is distinct from the application one
 # no need to mess the app with those classes
 Base = declarative_base()
 
 
+class InvalidDefinitionException(Exception):
+    pass
+
+
+# kinds deferred by the registry defer_blobs policy
+BLOB_KINDS = ('Binary', 'CompressedBinary', 'CompressedText', 'LargeBinary',
+              'Text')
+
+# loading strategies accepted by relationship(lazy=...)
+LAZY_STRATEGIES = ('select', 'selectin', 'joined', 'subquery', 'immediate',
+                   'raise', 'raise_on_sql', 'noload', 'dynamic')
+
+
+class Relation(namedtuple('Relation', (
+        'cardinality', 'collection', 'name', 'backref', 'external',
+        'tablename', 'lazy', 'backref_lazy'))):
+    """ Immutable description of a relation column
+
+        * cardinality: one (parent relation) or many
+        * collection, name: target dynamic table
+        * backref: optional name of the attribute added to the target
+        * external, tablename: class name and table name of a target
+          declared by the application, instead of collection and name
+        * lazy, backref_lazy: optional loading strategies of the relation
+          and of its backref, one of LAZY_STRATEGIES. The registry
+          default applies otherwise.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, attrs):
+        """ Relation from a definition dict, missing keys are None """
+
+        unknown = set(attrs) - set(cls._fields)
+        if unknown:
+            raise InvalidDefinitionException(
+                'unknown relation keys %s' % ', '.join(sorted(unknown)))
+        return cls(**dict((key, attrs.get(key)) for key in cls._fields))
+
+    def to_dict(self):
+        """ Definition dict, without the keys left to None """
+
+        return dict((key, value) for key, value in zip(self._fields, self)
+                    if value is not None)
+
+
+class JSONType(TypeDecorator):
+    """ Compact json, stored as bytes: the column type of the former
+        PickleType columns is kept
+    """
+
+    impl = LargeBinary
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(bytes(value).decode('utf-8'))
+
+
+class RelationType(JSONType):
+    """ Relation stored as a json object """
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, Relation):
+            value = value.to_dict()
+        return super(RelationType, self).process_bind_param(value, dialect)
+
+    def process_result_value(self, value, dialect):
+        value = super(RelationType, self).process_result_value(value, dialect)
+        if value is None:
+            return None
+        return Relation.from_dict(value)
+
+
+class DGeneration(Base):
+    """ Single row counter, incremented by every change in the catalog.
+        DTable and DColumn rows keep the generation of their last change.
+    """
+
+    __tablename__ = 'dynalchemy_generation'
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
 class DTable(Base):
 
     __tablename__ = 'dynalchemy_table'
@@ -23,12 +121,83 @@ class DTable(Base):
     name = Column(String, nullable=False)
     schema = Column(String)
     active = Column(Boolean, nullable=False, default=True)
+    generation = Column(Integer, index=True)
+    # list of lists of column names
+    unique_keys = Column(JSONType)
+    # list of dicts: columns (list of column names), unique, optional name
+    indexes = Column(JSONType)
 
     def get_name(self):
         """ a unique name for this table """
 
         return '%s__%s' % (self.collection, self.name)
 
+    def get_columns(self):
+        """ active columns of this table """
+
+        return [col for col in self.columns if col.active is not False]
+
+    def validate(self):
+        """ Ensure unique keys and indexes reference existing columns
+
+            :raise InvalidDefinitionException: on the first problem found
+        """
+
+        names = self._get_sa_names()
+        for key in self.unique_keys or []:
+            if not key or not set(key).issubset(names):
+                raise InvalidDefinitionException(
+                    'table %s: invalid unique key %s' % (self.name, key))
+        for index in self.indexes or []:
+            if not index.get('columns') or \
+                    not set(index['columns']).issubset(names):
+                raise InvalidDefinitionException(
+                    'table %s: invalid index %s' % (self.name, index))
+
+    def _get_sa_names(self):
+        """ sa column names by column name, many relationships excluded """
+
+        names = dict((col.name, col.get_name()) for col in self.get_columns()
+                     if not col.is_many_relationship())
+        names['id'] = 'id'
+        return names
+
+    def get_unique_keys(self):
+        """ unique keys as tuples of sa column names (name__id for parent
+            relationships)
+        """
+
+        names = self._get_sa_names()
+        return [tuple(names[colname] for colname in key)
+                for key in self.unique_keys or []]
+
+    def get_indexes(self):
+        """ composite indexes as (name, tuple of sa column names, unique)
+            Generated names have their own prefix, distinct from the ix_
+            of column indexes, and are conv labels (see to_sa)
+        """
+
+        names = self._get_sa_names()
+        indexes = []
+        for index in self.indexes or []:
+            columns = tuple(names[colname] for colname in index['columns'])
+            indexes.append((
+                index.get('name') or conv('cix_%s_%s' % (
+                    self.get_name(), '_'.join(columns))),
+                columns,
+                bool(index.get('unique'))))
+        return indexes
+
+    def get_dependencies(self):
+        """ (collection, name) of the tables referenced by parent relations:
+            they must be mapped before this one
+        """
+
+        return [
+            (col.relation.collection, col.relation.name)
+            for col in self.get_columns()
+            if col.is_parent_relationship() and not col.relation.external]
+
     def to_sa(self, registry):
         """ create mapped sa class from db definition """
 
@@ -41,13 +210,28 @@ class DTable(Base):
         parent_rels = {}
         if self.schema:
             dct['__table_args__']['schema'] = self.schema
-
-        for col in self.columns:
+        table_key = '%s.%s' % (self.schema, self.get_name()) if self.schema \
+            else self.get_name()
+        if table_key not in registry._base.metadata.tables:
+            # constraints are only declared once, tables are extended later.
+            # Generated names are conv labels: shortened with a hash, like
+            # the ones of column indexes, by dialects limiting their length
+            dct['__table_args__'] = tuple(
+                UniqueConstraint(*key, name=conv('%s__%s__key' % (
+                    self.get_name(), '_'.join(key))))
+                for key in self.get_unique_keys()) + tuple(
+                Index(index_name, *columns, unique=unique)
+                for index_name, columns, unique in self.get_indexes()) + (
+                dct['__table_args__'],)
+
+        for col in self.get_columns():
             if col.is_many_relationship():
                 continue
-            dct[col.get_name()] = col.to_sa()
+            dct[col.get_name()] = col.get_property(registry)
             if col.is_parent_relationship():
-                parent_rels[col.name] = col.get_parent_relationship(registry)
+                with registry._measure('relationship'):
+                    parent_rels[col.name] = \
+                        col.get_parent_relationship(registry)
 
         klass = type(str(self.get_name()), (registry._base,), dct)
         for key, val in parent_rels.items():
@@ -64,7 +248,7 @@ class DColumn(Base):
             as a convention. No column is created, but a relationship
         * ParentRelation:
             The kind is 'Integer'.
-            The foreign key takes the name col.name + '__id'
+            The foreign key takes the name col.name + '__id' and is indexed
     """
 
     COLUMN_TYPES = {
@@ -72,6 +256,10 @@ class DColumn(Base):
         'BigInteger': [],
         'Binary': [],
         'Boolean': [],
+        'CompressedBinary': [dict(name='codec', mandatory=False),
+                             dict(name='threshold', mandatory=False)],
+        'CompressedText': [dict(name='codec', mandatory=False),
+                           dict(name='threshold', mandatory=False)],
         'Date': [],
         'DateTime': [],
         'Enum': [dict(name='choices', mandatory=True)],
@@ -86,6 +274,10 @@ class DColumn(Base):
     }
 
     __tablename__ = 'dynalchemy_column'
+    __table_args__ = (
+        Index('ix_dynalchemy_column_target',
+              'target_collection', 'target_name'),
+    )
 
     id = Column(Integer, primary_key=True)
     table_id = Column(Integer, ForeignKey('dynalchemy_table.id'))
@@ -95,17 +287,90 @@ class DColumn(Base):
     nullable = Column(Boolean, nullable=False, default=False)
     default = Column(String)
     length = Column(Integer)
-    choices = Column(PickleType)
+    choices = Column(JSONType)
     precision = Column(Integer)
-    relation = Column(PickleType)
+    # compressed kinds: codec name and size under which values are raw
+    codec = Column(String)
+    threshold = Column(Integer)
+    relation = Column(RelationType)
+    # target of relation, copied to be queried
+    target_collection = Column(String)
+    target_name = Column(String)
+    index = Column(Boolean)
+    unique = Column(Boolean)
+    # loaded on first access, with the other columns of deferred_group;
+    # None follows the registry defer_blobs policy
+    deferred = Column(Boolean)
+    deferred_group = Column(String)
+    generation = Column(Integer, index=True)
 
     table = relationship(DTable, backref='columns') #backref('columns', lazy='joined'))
 
+    @validates('relation')
+    def _set_relation(self, key, relation):
+        """ Definition dicts are converted to Relation """
+
+        if isinstance(relation, dict):
+            relation = Relation.from_dict(relation)
+        if relation is not None:
+            self.target_collection = relation.collection
+            self.target_name = relation.name
+        return relation
+
     def validate(self):
-        """ Ensure attributes correctness
-            Should check type/value for default, length, choices...
+        """ Ensure attributes correctness: kind, mandatory args, default
+            and relation
+
+            :raise InvalidDefinitionException: on the first problem found
         """
-        pass
+
+        if not self.name:
+            raise InvalidDefinitionException('column name is mandatory')
+        if self.is_relationship():
+            return self._validate_relation()
+
+        kind = self.kind or 'String'
+        if kind not in DColumn.COLUMN_TYPES:
+            raise InvalidDefinitionException(
+                'column %s: unknown kind %s' % (self.name, kind))
+        for arg in DColumn.COLUMN_TYPES[kind]:
+            if arg['mandatory'] and not getattr(self, arg['name']):
+                raise InvalidDefinitionException('column %s: %s is mandatory'
+                                                 % (self.name, arg['name']))
+        if self.codec is not None and self.codec not in CODECS:
+            raise InvalidDefinitionException(
+                'column %s: unknown codec %s' % (self.name, self.codec))
+        if self.default is not None:
+            try:
+                self._get_default()
+            except (TypeError, ValueError):
+                raise InvalidDefinitionException(
+                    'column %s: invalid default %r' % (self.name, self.default))
+
+    def _validate_relation(self):
+        """ Ensure a relation is complete """
+
+        relation = self.relation or Relation.from_dict({})
+        if relation.cardinality not in ('one', 'many'):
+            raise InvalidDefinitionException(
+                'column %s: cardinality must be one or many' % self.name)
+        if relation.external:
+            if relation.cardinality != 'one' or not relation.tablename:
+                raise InvalidDefinitionException(
+                    'column %s: external relations need a tablename and '
+                    'a cardinality one' % self.name)
+        elif not relation.collection or not relation.name:
+            raise InvalidDefinitionException(
+                'column %s: relation needs collection and name' % self.name)
+        for key in ('lazy', 'backref_lazy'):
+            if getattr(relation, key) not in (None,) + LAZY_STRATEGIES:
+                raise InvalidDefinitionException(
+                    'column %s: unknown loading strategy %s' % (
+                        self.name, getattr(relation, key)))
+        if relation.cardinality == 'one' and relation.lazy == 'dynamic':
+            raise InvalidDefinitionException(
+                'column %s: dynamic loading needs a cardinality many'
+                % self.name)
 
     def get_name(self):
         """ Return name of the columm: name for std cols, name__id for
@@ -128,23 +393,23 @@ class DColumn(Base):
     def is_parent_relationship(self):
         """ True if the column is a parent relationship """
 
-        return self.is_relationship() and self.relation['cardinality'] == 'one'
+        return self.is_relationship() and self.relation.cardinality == 'one'
 
     def is_many_relationship(self):
         """ True if the column is a many relationship """
 
-        return self.is_relationship() and self.relation['cardinality'] == 'many'
+        return self.is_relationship() and self.relation.cardinality == 'many'
 
     def get_secondary_tablename(self):
         """ return the name of the secondary table in a many relationship """
 
         return '%s__%s__association' % (
-            self.table.name, self.relation['name'])
+            self.table.name, self.relation.name)
 
     def get_remote(self, registry):
         """ return the remote SA model in a relationship """
 
-        return registry.get(self.relation['collection'], self.relation['name'])
+        return registry.get(self.relation.collection, self.relation.name)
 
     def get_secondary(self, registry):
         """ return the secondary SA model in a many relationship """
@@ -153,33 +418,48 @@ class DColumn(Base):
             self.table.collection,
             self.get_secondary_tablename())
 
+    def get_lazy(self, registry):
+        """ loading strategies of the relation and of its backref """
+
+        default = registry.relation_lazy or 'select'
+        return (self.relation.lazy or default,
+                self.relation.backref_lazy or default)
+
     def get_parent_relationship(self, registry):
         """ return the SA model in a parent relationship """
 
-        bref_name = self.relation.get('backref',
-            '%s_collection' % self.table.name)
+        bref_name = self.relation.backref or \
+            '%s_collection' % self.table.name
+        lazy, bref_lazy = self.get_lazy(registry)
+        if lazy == 'dynamic':
+            # a many to one relation is a scalar
+            lazy = 'select'
 
-        if 'external' in self.relation:
-            remote = self.relation['external']
+        if self.relation.external:
+            remote = self.relation.external
         else:
             remote = self.get_remote(registry)
         return relationship(
             remote,
             cascade="save-update, merge",
-            backref=backref(bref_name, cascade="all, delete-orphan")
+            lazy=lazy,
+            backref=backref(bref_name, cascade="all, delete-orphan",
+                            lazy=bref_lazy)
         )
 
     def get_many_relationship(self, registry):
         """ return the SA relationship in a many relationship """
 
-        bref_name = self.relation.get('backref',
-            '%s_collection' % self.table.name)
+        bref_name = self.relation.backref or \
+            '%s_collection' % self.table.name
+        lazy, bref_lazy = self.get_lazy(registry)
 
         return relationship(
             self.get_remote(registry),
             secondary=self.get_secondary(registry).__table__,
             cascade="save-update, merge",
-            backref=backref(bref_name)
+            lazy=lazy,
+            backref=backref(bref_name, lazy=bref_lazy)
         )
 
     def _get_type(self):
@@ -187,12 +467,16 @@ class DColumn(Base):
 
         if self.is_parent_relationship():
             kind = Integer
+        elif self.kind in TYPES:
+            kind = TYPES[self.kind](self.codec, self.threshold)
         else:
             kind = getattr(sqlalchemy, self.kind)
             if self.kind == 'String' and self.length:
                 kind = kind(self.length)
             if self.kind == 'Enum':
                 kind = kind(*self.choices)
+            if self.kind in ('Numeric', 'Float') and self.precision:
+                kind = kind(precision=self.precision)
         return kind
 
     def _get_default(self):
@@ -216,8 +500,11 @@ class DColumn(Base):
         args = {}
         if self.default is not None:
             args['default'] = self._get_default()
-        if self.kind in ('Numeric', 'Float') and self.precision:
-            args['precision'] = self.precision
+        # foreign keys are always indexed
+        if self.index or self.unique or self.is_parent_relationship():
+            args['index'] = True
+        if self.unique:
+            args['unique'] = True
         return args
 
     def to_sa(self):
@@ -229,14 +516,34 @@ class DColumn(Base):
         args = self._get_args()
         kind = self._get_type()
         if self.is_parent_relationship():
-            if 'external' in self.relation:
-                fkey = '%s.id' % self.relation['tablename']
+            if self.relation.external:
+                fkey = '%s.id' % self.relation.tablename
             else:
-                fkey = '%(collection)s__%(name)s.id' % self.relation
+                fkey = '%s__%s.id' % (
+                    self.relation.collection, self.relation.name)
             return Column(self.get_name(), kind, ForeignKey(fkey), **args)
         else:
             return Column(self.get_name(), kind, **args)
 
+    def is_deferred(self, registry):
+        """ True if the column is loaded on first access """
+
+        if self.deferred is not None:
+            return self.deferred
+        if self.deferred_group:
+            return True
+        return registry.defer_blobs and self.kind in BLOB_KINDS
+
+    def get_property(self, registry):
+        """ Column of the sa model, wrapped in a deferred property when
+            the column is deferred
+        """
+
+        column = self.to_sa()
+        if self.is_parent_relationship() or not self.is_deferred(registry):
+            return column
+        return deferred(column, group=self.deferred_group)
+
     @classmethod
     def get_serialization_fields(cls, kind):
         """ List fields availables for Column declaration of one type """
@@ -248,7 +555,8 @@ class DColumn(Base):
             dict(name='default', nullable=True),
         ]
 
-        fields += DColumn.COLUMN_TYPES[kind]
+        # copies: values are set on them
+        fields += [dict(field) for field in DColumn.COLUMN_TYPES[kind]]
         return fields
 
     def serialize(self):
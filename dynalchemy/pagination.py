@@ -0,0 +1,151 @@
+""" Keyset pagination of dynamic tables
+
+Pages are selected with a WHERE clause seeking past the last row of the
+previous page instead of an OFFSET: every page costs the same, however
+deep. Rows are ordered by indexed columns, id last to break ties, and
+the keyset columns are expected to be non null. Tokens carry the values
+of the last row encoded as in exports, Numeric ones as strings: they are
+decoded by the coercer of their column, to Decimal without rounding.
+"""
+
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+from .coerce import coercer
+from .export import ENCODERS
+from .models import InvalidDefinitionException
+
+Page = namedtuple('Page', 'items next_token')
+Page.__doc__ = """ Rows of a page and the token of the next one, None
+    on the last page
+"""
+
+
+def _indexed(dtable):
+    """ tuples of sa column names of the indexes of dtable """
+
+    indexed = [('id',)]
+    for col in dtable.get_columns():
+        if col.index or col.unique or col.is_parent_relationship():
+            indexed.append((col.get_name(),))
+    indexed += dtable.get_unique_keys()
+    indexed += [columns for _, columns, _ in dtable.get_indexes()]
+    return indexed
+
+
+class Paginator(object):
+    """ Keyset paginator of a dynamic model
+
+        :param session: sqlalchemy session
+        :param model: sqlalchemy model of dtable
+        :param dtable: DTable
+        :param order_by: optional list of column names, the leading
+            columns of an index of the table
+    """
+
+    def __init__(self, session, model, dtable, order_by=None):
+
+        self.session = session
+        self.model = model
+        names = dtable._get_sa_names()
+        try:
+            keys = [names[colname] for colname in order_by or []]
+        except KeyError as exc:
+            raise InvalidDefinitionException('unknown column %s' % exc)
+        if keys and not any(tuple(keys) == columns[:len(keys)]
+                            for columns in _indexed(dtable)):
+            raise InvalidDefinitionException(
+                'no index on %s' % ', '.join(keys))
+        if 'id' not in keys:
+            keys.append('id')
+        self.keys = keys
+        self.columns = [model.__table__.c[key] for key in keys]
+
+        dcols = dict((col.get_name(), col) for col in dtable.get_columns()
+                     if not col.is_many_relationship())
+        self._encoders = [
+            None if key == 'id' else ENCODERS.get(dcols[key].kind)
+            for key in keys]
+        self._decoders = [
+            int if key == 'id' else coercer(dcols[key]) for key in keys]
+
+    def page(self, token=None, page_size=100, query=None):
+        """ One page of rows
+
+            :param token: next_token of the previous page, None for the
+                first one
+            :param page_size: number of rows
+            :param query: optional unordered query of the model, filtered
+                as needed
+            :return: Page
+        """
+
+        if query is None:
+            query = self.session.query(self.model)
+        query = query.order_by(*self.columns)
+        if token is not None:
+            query = query.filter(self._seek(self.decode(token)))
+        items = query.limit(page_size + 1).all()
+        if len(items) <= page_size:
+            return Page(items, None)
+        items = items[:page_size]
+        return Page(items, self.encode(items[-1]))
+
+    def batches(self, batch_size=1000, query=None):
+        """ Generator walking the whole table in batches of rows
+
+            :param batch_size: number of rows per batch
+            :param query: optional unordered query of the model
+            :return: iterator of lists of rows
+        """
+
+        token = None
+        while True:
+            page = self.page(token, batch_size, query)
+            if page.items:
+                yield page.items
+            if page.next_token is None:
+                return
+            token = page.next_token
+
+    def _seek(self, values):
+        """ clause selecting the rows after values in keyset order """
+
+        clauses = []
+        for i, column in enumerate(self.columns):
+            clauses.append(and_(*[
+                col == value for col, value in zip(self.columns[:i], values)
+            ] + [column > values[i]]))
+        return or_(*clauses)
+
+    def encode(self, item):
+        """ Opaque token of the position after item """
+
+        values = []
+        for key, encode in zip(self.keys, self._encoders):
+            value = getattr(item, key)
+            values.append(value if encode is None or value is None
+                          else encode(value))
+        data = json.dumps(dict(k=self.keys, v=values), separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8'))\
+            .decode('ascii').rstrip('=')
+
+    def decode(self, token):
+        """ keyset values of a token
+
+            :raise ValueError: if the token was not produced by a
+                paginator of the same order
+        """
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(
+                token + '=' * (-len(token) % 4)).decode('utf-8'))
+            if data['k'] != self.keys:
+                raise ValueError
+            return [decode(value) for decode, value in zip(
+                self._decoders, data['v'])]
+        except (TypeError, ValueError, KeyError):
+            raise ValueError('invalid pagination token')
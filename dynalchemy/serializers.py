@@ -0,0 +1,92 @@
+""" Row serializers compiled from the column definitions of a table
+
+A serializer converts instances of a dynamic model, or result rows of its
+table, to dicts by sa column name (name__id for parent relations) and to
+json. Values are encoded as in exports: dates and times in iso format,
+binaries in base64, Numeric as float. Enum values are already strings.
+Deferred columns are left out by default: reading them from instances
+would issue one query per row.
+"""
+
+import json
+from keyword import iskeyword
+
+from .export import ENCODERS
+
+# kind: encoder, in addition to the export ones
+SERIALIZERS = dict(ENCODERS, Numeric=float)
+
+
+def _getter(attr):
+    """ python expression reading attr of obj """
+
+    if attr.isidentifier() and not iskeyword(attr):
+        return 'obj.%s' % attr
+    return 'getattr(obj, %r)' % attr
+
+
+class RowSerializer(object):
+    """ Serializer of the rows of one table
+
+        :param dtable: DTable, its active columns are compiled once in
+            a dedicated function
+        :param fields: optional list of column names, id is always
+            serialized. All columns by default, but the ones deferred by
+            registry
+        :param registry: optional Registry, deferring columns
+    """
+
+    def __init__(self, dtable, fields=None, registry=None):
+
+        columns = [col for col in dtable.get_columns()
+                   if not col.is_many_relationship()]
+        if fields is None:
+            columns = [col for col in columns
+                       if registry is None or not col.is_deferred(registry)]
+        else:
+            names = dict((col.name, col) for col in columns)
+            unknown = set(fields).difference(names, ['id'])
+            if unknown:
+                raise KeyError('unknown columns %s' % ', '.join(
+                    sorted(unknown)))
+            columns = [names[name] for name in fields if name != 'id']
+
+        fields = [('id', None)]
+        for col in columns:
+            kind = 'Integer' if col.is_parent_relationship() else col.kind
+            fields.append((col.get_name(), SERIALIZERS.get(kind)))
+        self.fields = [name for name, _ in fields]
+
+        namespace = {}
+        plain = [name for name, encode in fields if encode is None]
+        lines = ['def to_dict(obj):', '    row = {%s}' % ', '.join(
+            '%r: %s' % (name, _getter(name)) for name in plain)]
+        for i, (name, encode) in enumerate(fields):
+            if encode is None:
+                continue
+            namespace['encode%d' % i] = encode
+            lines += [
+                '    value = %s' % _getter(name),
+                '    row[%r] = None if value is None else encode%d(value)' % (
+                    name, i),
+            ]
+        lines.append('    return row')
+        exec('\n'.join(lines), namespace)
+        self.to_dict = namespace['to_dict']
+        self.to_dict.__doc__ = """ dict of the values of obj by column name """
+
+    def to_json(self, obj):
+        """ json object of obj """
+
+        return json.dumps(self.to_dict(obj), separators=(',', ':'))
+
+    def to_dicts(self, objs):
+        """ list of dicts of a batch of instances or rows """
+
+        to_dict = self.to_dict
+        return [to_dict(obj) for obj in objs]
+
+    def to_json_many(self, objs):
+        """ json array of a batch of instances or rows """
+
+        return json.dumps(self.to_dicts(objs), separators=(',', ':'))
@@ -0,0 +1,106 @@
+""" Local snapshot of the registry catalog
+
+The snapshot is a json file holding active table & column definitions in
+dependency order. It is only used when its fingerprint still matches the
+one computed from the database.
+"""
+
+import json
+import os
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models import DColumn, DGeneration, DTable, Relation
+
+# bump when the file layout or the catalog tables change
+VERSION = 7
+
+
+def _attributes(model):
+    """ mapped column attributes of a catalog model """
+
+    return [attr.key for attr in inspect(model).column_attrs]
+
+
+def _value(obj, key):
+    """ json compatible attribute of a catalog object """
+
+    value = getattr(obj, key)
+    if isinstance(value, Relation):
+        return value.to_dict()
+    return value
+
+
+def fingerprint(session):
+    """ Cheap summary of the catalog: any add or deprecation changes it
+
+        :return: list of integers, the schema generation first
+    """
+
+    summary = [
+        select([DGeneration.value]).where(DGeneration.id == 1).as_scalar()]
+    for model in (DTable, DColumn):
+        summary += [
+            select([func.count(model.id)]).as_scalar(),
+            select([func.max(model.id)]).as_scalar(),
+            select([func.count(model.id)]).where(
+                model.active == True).as_scalar(),
+        ]
+    row = session.execute(select(summary)).first()
+    return [value or 0 for value in row]
+
+
+def dump(path, fprint, tables):
+    """ Write tables definitions to path
+
+        :param path: file path
+        :param fprint: fingerprint of the catalog
+        :param tables: list of DTable in dependency order
+    """
+
+    table_attrs = _attributes(DTable)
+    column_attrs = _attributes(DColumn)
+    data = {
+        'version': VERSION,
+        'fingerprint': fprint,
+        'tables': [
+            dict(
+                [(key, _value(table, key)) for key in table_attrs],
+                columns=[
+                    dict((key, _value(col, key)) for key in column_attrs)
+                    for col in table.get_columns()])
+            for table in tables]
+    }
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+
+def load(path, fprint):
+    """ Read tables definitions from path
+
+        :param path: file path
+        :param fprint: current fingerprint of the catalog
+        :return: list of detached DTable or None if the snapshot is missing
+            or outdated
+    """
+
+    try:
+        with open(path) as fp:
+            data = json.load(fp)
+    except (IOError, ValueError):
+        return None
+    if data.get('version') != VERSION or data.get('fingerprint') != fprint:
+        return None
+
+    tables = []
+    for attrs in data['tables']:
+        columns = [DColumn(**col) for col in attrs.pop('columns')]
+        table = DTable(**attrs)
+        table.columns = columns
+        for obj in [table] + columns:
+            make_transient_to_detached(obj)
+        tables.append(table)
+    return tables
@@ -0,0 +1,88 @@
+""" Instrumentation of Registry operations
+
+Events:
+    * catalog_query: timed, query of the catalog tables
+    * model_build: timed, construction of a mapped class
+    * relationship: timed, resolution of a relationship and its target
+    * ddl: timed, CREATE / ALTER statements issued by the registry
+    * get_hit, get_miss: counted, lookups of get
+
+Hooks are called with the event name and the duration in seconds of
+timed events, None for counted ones.
+"""
+
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# upper bounds in seconds of the latency histograms buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+class Stats(object):
+    """ Counters and latency histograms by event name """
+
+    def __init__(self):
+
+        self._lock = Lock()
+        self.counters = {}
+        self.timers = {}
+        self.hooks = []
+
+    def incr(self, event):
+        """ Count one occurrence of event """
+
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + 1
+        for hook in self.hooks:
+            hook(event, None)
+
+    def observe(self, event, duration):
+        """ Record the duration of event, in seconds """
+
+        with self._lock:
+            timer = self.timers.get(event)
+            if timer is None:
+                timer = self.timers[event] = dict(
+                    count=0, total=0.0, max=0.0,
+                    buckets=[0] * (len(BUCKETS) + 1))
+            timer['count'] += 1
+            timer['total'] += duration
+            timer['max'] = max(timer['max'], duration)
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    break
+            else:
+                i = len(BUCKETS)
+            timer['buckets'][i] += 1
+        for hook in self.hooks:
+            hook(event, duration)
+
+    @contextmanager
+    def measure(self, event):
+        """ Context manager timing event """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(event, time.perf_counter() - start)
+
+    def snapshot(self):
+        """ Copy of the stats
+
+            :return: dict with counters, by event name, and timers, by
+                event name dicts of count, total, max and buckets, a list
+                of [upper bound, count], the last bound being None
+        """
+
+        bounds = list(BUCKETS) + [None]
+        with self._lock:
+            return dict(
+                counters=dict(self.counters),
+                timers=dict(
+                    (event, dict(count=timer['count'], total=timer['total'],
+                                 max=timer['max'],
+                                 buckets=[list(bucket) for bucket in zip(
+                                     bounds, timer['buckets'])]))
+                    for event, timer in self.timers.items()))
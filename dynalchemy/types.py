@@ -0,0 +1,101 @@
+""" Column types of the kinds that are not plain sqlalchemy types
+
+Compressed kinds store their values in a binary column, prefixed by one
+byte telling the codec used. Values shorter than the threshold, or that
+do not shrink, are stored as they are. Values stay readable when the
+codec or the threshold of a column change.
+"""
+
+import lzma
+import zlib
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+RAW = b'\x00'
+
+# codec: prefix, compress, decompress
+CODECS = {
+    'zlib': (b'\x01', zlib.compress, zlib.decompress),
+    'lzma': (b'\x02', lzma.compress, lzma.decompress),
+}
+
+_DECOMPRESS = dict((prefix, decompress)
+                   for prefix, _, decompress in CODECS.values())
+
+
+def compress(data, codec='zlib', threshold=0):
+    """ Prefixed, compressed if worth it, data
+
+        :param data: bytes
+        :param codec: key of CODECS
+        :param threshold: size under which data is not compressed
+        :return: bytes
+    """
+
+    if len(data) >= threshold:
+        prefix, func, _ = CODECS[codec]
+        compressed = func(data)
+        if len(compressed) < len(data):
+            return prefix + compressed
+    return RAW + data
+
+
+def decompress(stored):
+    """ data from the output of compress """
+
+    stored = bytes(stored)
+    prefix, data = stored[:1], stored[1:]
+    if prefix == RAW:
+        return data
+    return _DECOMPRESS[prefix](data)
+
+
+class CompressedBinary(TypeDecorator):
+    """ bytes compressed in a binary column
+
+        :param codec: zlib or lzma
+        :param threshold: size in bytes under which values are not
+            compressed
+    """
+
+    impl = LargeBinary
+
+    def __init__(self, codec=None, threshold=None):
+
+        super(CompressedBinary, self).__init__()
+        self.codec = codec or 'zlib'
+        self.threshold = threshold or 0
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(self._to_bytes(value), self.codec, self.threshold)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._from_bytes(decompress(value))
+
+    def _to_bytes(self, value):
+        return bytes(value)
+
+    def _from_bytes(self, data):
+        return data
+
+
+class CompressedText(CompressedBinary):
+    """ str compressed in a binary column, utf-8 encoded """
+
+    def _to_bytes(self, value):
+        return value.encode('utf-8')
+
+    def _from_bytes(self, data):
+        return data.decode('utf-8')
+
+
+# kind: type built with the codec and threshold of the column
+TYPES = {
+    'CompressedBinary': CompressedBinary,
+    'CompressedText': CompressedText,
+}
@@ -0,0 +1,102 @@
+""" Set based insert or update of rows on a unique key
+
+Rows given to these functions are already converted and all have the
+same keys, key columns included.
+"""
+
+import sqlite3
+
+from sqlalchemy import and_, bindparam, or_, select, text
+from sqlalchemy.dialects import postgresql
+
+
+def upsert(con, table, key, params):
+    """ Insert params in table, update the rows whose key already exists
+
+        :param con: sqlalchemy connection
+        :param table: sqlalchemy Table
+        :param key: tuple of column names with a unique constraint
+        :param params: list of dicts
+    """
+
+    dialect = con.dialect.name
+    if dialect == 'postgresql':
+        return upsert_postgresql(con, table, key, params)
+    if dialect == 'sqlite' and sqlite3.sqlite_version_info >= (3, 24):
+        return upsert_sqlite(con, table, key, params)
+    return upsert_select(con, table, key, params)
+
+
+def upsert_postgresql(con, table, key, params):
+    """ INSERT ... ON CONFLICT DO UPDATE with the postgresql dialect """
+
+    stmt = postgresql.insert(table)
+    updated = [col for col in sorted(params[0]) if col not in key]
+    if updated:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_=dict((col, stmt.excluded[col]) for col in updated))
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(key))
+    con.execute(stmt, params)
+
+
+def upsert_sqlite(con, table, key, params):
+    """ INSERT ... ON CONFLICT DO UPDATE, sqlite >= 3.24 """
+
+    preparer = con.dialect.identifier_preparer
+    columns = sorted(params[0])
+    updated = [col for col in columns if col not in key]
+    if updated:
+        action = 'UPDATE SET ' + ', '.join(
+            '%s = excluded.%s' % (preparer.quote(col), preparer.quote(col))
+            for col in updated)
+    else:
+        action = 'NOTHING'
+    sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO %s' % (
+        preparer.format_table(table),
+        ', '.join(preparer.quote(col) for col in columns),
+        ', '.join(':p%d' % i for i in range(len(columns))),
+        ', '.join(preparer.quote(col) for col in key),
+        action)
+    # typed: values go through the bind processing of their column
+    stmt = text(sql).bindparams(*[
+        bindparam('p%d' % i, type_=table.c[col].type)
+        for i, col in enumerate(columns)])
+    con.execute(stmt, [
+        dict(('p%d' % i, row[col]) for i, col in enumerate(columns))
+        for row in params])
+
+
+def upsert_select(con, table, key, params):
+    """ Portable fallback: select existing keys of the chunk, then one
+        executemany update and one executemany insert
+    """
+
+    # last row wins when a key is repeated in the chunk
+    rows = dict((tuple(row[col] for col in key), row) for row in params)
+    key_cols = [table.c[col] for col in key]
+    if len(key) == 1:
+        where = key_cols[0].in_([values[0] for values in rows])
+    else:
+        where = or_(*[
+            and_(*[col == value for col, value in zip(key_cols, values)])
+            for values in rows])
+    existing = set(tuple(row) for row in con.execute(
+        select(key_cols).where(where)))
+
+    updated = [col for col in sorted(params[0]) if col not in key]
+    updates = [row for values, row in rows.items() if values in existing]
+    inserts = [row for values, row in rows.items() if values not in existing]
+    if updates and updated:
+        stmt = table.update().where(and_(*[
+            col == bindparam('_k%d' % i) for i, col in enumerate(key_cols)]))\
+            .values(dict(
+                (table.c[col], bindparam('_v%d' % i))
+                for i, col in enumerate(updated)))
+        con.execute(stmt, [
+            dict([('_k%d' % i, row[col]) for i, col in enumerate(key)] +
+                 [('_v%d' % i, row[col]) for i, col in enumerate(updated)])
+            for row in updates])
+    if inserts:
+        con.execute(table.insert(), inserts)
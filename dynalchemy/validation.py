@@ -0,0 +1,162 @@
+""" Row validators compiled from the column definitions of a table
+
+Rows are dicts by sa column name, name__id for parent relations. A
+validator coerces raw values (json, csv...) to the python type of their
+column, fills defaults and checks nullability, length, Enum choices and
+precision. Problems are reported as FieldError, never raised.
+Conversions are the strict ones of bulk_insert, see coerce.
+"""
+
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from .coerce import coercer, to_int
+
+FieldError = namedtuple('FieldError', 'row field code message')
+FieldError.__doc__ = """ Problem found in a row
+
+    * row: index of the row in a batch, None for a single row
+    * field: column name
+    * code: unknown, required, type, length, choice or precision
+    * message: human readable description
+"""
+
+
+class _Invalid(Exception):
+
+    def __init__(self, code, message):
+        super(_Invalid, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _max_length(length):
+
+    def check(value):
+        if len(value) > length:
+            raise _Invalid('length', 'longer than %d' % length)
+    return check
+
+
+def _choice(choices):
+    choices = frozenset(choices)
+
+    def check(value):
+        if value not in choices:
+            raise _Invalid('choice', '%r is not one of %s' % (
+                value, ', '.join(sorted(choices))))
+    return check
+
+
+def _precision(precision):
+
+    def check(value):
+        try:
+            digits = Decimal(str(value)).normalize().as_tuple().digits
+        except InvalidOperation:
+            return
+        if len(digits) > precision:
+            raise _Invalid('precision', 'more than %d digits' % precision)
+    return check
+
+
+def _field(dcol):
+    """ Function coercing and checking one value of dcol, not None """
+
+    convert = coercer(dcol)
+    kind = 'Integer' if dcol.is_parent_relationship() else dcol.kind
+    checks = []
+    if kind in ('String', 'Text', 'LargeBinary') and dcol.length:
+        checks.append(_max_length(dcol.length))
+    elif kind == 'Enum':
+        checks.append(_choice(dcol.choices))
+    elif kind in ('Float', 'Numeric') and dcol.precision:
+        checks.append(_precision(dcol.precision))
+
+    def field(value):
+        try:
+            value = convert(value)
+        except (TypeError, ValueError) as exc:
+            raise _Invalid('type', 'invalid %s: %s' % (kind, exc))
+        for check in checks:
+            check(value)
+        return value
+    return field
+
+
+def _field_id(value):
+    try:
+        return to_int(value)
+    except (TypeError, ValueError) as exc:
+        raise _Invalid('type', 'invalid Integer: %s' % exc)
+
+
+class RowValidator(object):
+    """ Validator and coercer of the rows of one table
+
+        :param dtable: DTable, its active columns are compiled once
+    """
+
+    def __init__(self, dtable):
+
+        self.fields = {'id': _field_id}
+        self.defaults = {}
+        self.required = []
+        for col in dtable.get_columns():
+            if col.is_many_relationship():
+                continue
+            name = col.get_name()
+            self.fields[name] = _field(col)
+            if col.default is not None:
+                self.defaults[name] = col._get_default()
+            elif not col.nullable:
+                self.required.append(name)
+
+    def validate(self, row, index=None):
+        """ Coerce and check one row
+
+            :param row: dict of raw values
+            :param index: index of the row reported in errors
+            :return: (dict of coerced values, defaults included,
+                list of FieldError), values of invalid fields are omitted
+        """
+
+        values = {}
+        errors = []
+        for key, value in row.items():
+            field = self.fields.get(key)
+            if field is None:
+                errors.append(FieldError(index, key, 'unknown',
+                                         'unknown column'))
+                continue
+            if value is None:
+                values[key] = None
+                continue
+            try:
+                values[key] = field(value)
+            except _Invalid as exc:
+                errors.append(FieldError(index, key, exc.code, exc.message))
+        for key, default in self.defaults.items():
+            if key not in row:
+                values[key] = default
+        for key in self.required:
+            if row.get(key) is None:
+                errors.append(FieldError(index, key, 'required',
+                                         'value is mandatory'))
+        return values, errors
+
+    def validate_many(self, rows):
+        """ Coerce and check a batch of rows
+
+            :param rows: iterable of dicts of raw values
+            :return: (list of dicts of coerced values, in rows order,
+                list of FieldError with the index of their row)
+        """
+
+        batch = []
+        errors = []
+        for index, row in enumerate(rows):
+            values, row_errors = self.validate(row, index)
+            batch.append(values)
+            errors.extend(row_errors)
+        return batch, errors
@@ -12,4 +12,5 @@ setup(
     package_dir={'dynalchemy': 'dynalchemy'},
     license="MIT License",
     install_requires=['sqlalchemy'],
+    extras_require={'numpy': ['numpy']},
 )
\ No newline at end of file
@@ -0,0 +1,45 @@
+import asyncio
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import AsyncRegistry
+
+
+class TestAsyncRegistry(unittest.TestCase):
+
+    def test_registry(self):
+
+        async def scenario():
+            engine = create_engine('sqlite:///:memory:', echo=False)
+            base = declarative_base(bind=engine)
+            reg = await AsyncRegistry.create(base, sessionmaker(bind=engine)())
+            Bird = await reg.add('animal', 'bird', columns=[
+                dict(name='name', kind='String'),
+            ])
+            await reg.add_column('animal', 'bird',
+                                 dict(name='color', kind='String'))
+            counts = await reg.bulk_insert('animal', 'bird', [
+                dict(name='pinson', color='red')])
+            self.assertEqual(counts, [1])
+
+            models = await asyncio.gather(
+                reg.get('animal', 'bird'), reg.list('animal'))
+            self.assertEqual(models, [Bird, [Bird]])
+
+            query = reg.registry.session.query(Bird)
+            birds = await reg.run(query.all)
+            self.assertEqual(birds[0].color, 'red')
+
+            await reg.deprecate('animal', 'bird')
+            self.assertEqual(await reg.list('animal'), [])
+            await reg.run(base.metadata.drop_all)
+            await reg.close()
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
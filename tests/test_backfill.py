@@ -0,0 +1,60 @@
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.backfill import Backfill
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        Bird = self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.reg.session.add_all(
+            [Bird(name='bird%d' % i) for i in range(25)])
+        self.reg.session.commit()
+        self.reg.add_column('animal', 'bird', dict(
+            name='nb_wings', kind='Integer', default='2', nullable=True))
+
+    def tearDown(self):
+        self.reg.destroy()
+
+    def _values(self):
+        Bird = self.reg.get('animal', 'bird')
+        self.reg.session.expire_all()
+        return [bird.nb_wings for bird in self.reg.session.query(Bird)]
+
+    def test_default(self):
+        states = []
+        updated = self.reg.backfill('animal', 'bird', 'nb_wings',
+                                    chunk_size=10, progress=states.append)
+        self.assertEqual(updated, 25)
+        self.assertEqual(self._values(), [2] * 25)
+        self.assertEqual([s.checkpoint for s in states], [10, 20, 25])
+
+    def test_resume(self):
+        backfill = Backfill(self.reg, 'animal', 'bird', 'nb_wings',
+                            chunk_size=10)
+        state = next(backfill.chunks())
+        self.assertEqual(state.updated, 10)
+        self.assertEqual(self._values().count(None), 15)
+        self.assertEqual(backfill.run(state.checkpoint), 15)
+        self.assertEqual(self._values(), [2] * 25)
+
+    def test_computed(self):
+        updated = self.reg.backfill(
+            'animal', 'bird', 'nb_wings', chunk_size=7,
+            value=lambda row: len(row['name']))
+        self.assertEqual(updated, 25)
+        self.assertEqual(self._values(), [5] * 10 + [6] * 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
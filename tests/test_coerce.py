@@ -0,0 +1,59 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from dynalchemy.coerce import coercer
+from dynalchemy.models import DColumn
+
+
+class TestCoercer(unittest.TestCase):
+
+    def _coerce(self, kind, value, **attrs):
+        return coercer(DColumn(name='col', kind=kind, **attrs))(value)
+
+    def test_none(self):
+        self.assertIsNone(self._coerce('Integer', None))
+
+    def test_numbers(self):
+        self.assertEqual(self._coerce('Integer', '12'), 12)
+        self.assertEqual(self._coerce('Integer', 4.0), 4)
+        self.assertEqual(self._coerce('Float', '1.5'), 1.5)
+        self.assertEqual(self._coerce('Numeric', '1.10'), Decimal('1.10'))
+        self.assertEqual(self._coerce('Numeric', 0.1), Decimal('0.1'))
+        for value in (3.7, '3.7', True, float('nan')):
+            self.assertRaises((TypeError, ValueError), self._coerce,
+                              'Integer', value)
+        for value in ('abc', 'inf', True, [1]):
+            self.assertRaises((TypeError, ValueError), self._coerce,
+                              'Numeric', value)
+
+    def test_bool(self):
+        self.assertEqual(self._coerce('Boolean', 'Yes'), True)
+        self.assertEqual(self._coerce('Boolean', '0'), False)
+        self.assertEqual(self._coerce('Boolean', 1), True)
+        self.assertEqual(self._coerce('Boolean', 'off'), False)
+        for value in ('banana', 2, [True]):
+            self.assertRaises(ValueError, self._coerce, 'Boolean', value)
+
+    def test_dates(self):
+        self.assertEqual(self._coerce('Date', '2017-03-13'),
+                         datetime.date(2017, 3, 13))
+        self.assertEqual(self._coerce('DateTime', '2017-03-13T09:24:58'),
+                         datetime.datetime(2017, 3, 13, 9, 24, 58))
+        self.assertEqual(self._coerce('Time', '09:24'), datetime.time(9, 24))
+
+    def test_text_and_bytes(self):
+        self.assertEqual(self._coerce('String', 12), '12')
+        self.assertEqual(self._coerce('LargeBinary', bytearray(b'abc')),
+                         b'abc')
+        self.assertRaises(TypeError, self._coerce, 'String', {'a': 1})
+        for value in ('abc', 10 ** 9):
+            self.assertRaises(TypeError, self._coerce, 'LargeBinary', value)
+
+    def test_parent_relation(self):
+        self.assertEqual(self._coerce('Relation', '3', relation={
+            'collection': 'a', 'name': 'b', 'cardinality': 'one'}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import datetime
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestReadColumns(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='nb_wings', kind='Integer', nullable=True),
+            dict(name='weight', kind='Float'),
+            dict(name='flying', kind='Boolean'),
+            dict(name='born', kind='DateTime', nullable=True),
+        ])
+        self.reg.bulk_insert('animal', 'bird', [
+            dict(name='bird%d' % i, nb_wings=None if i % 2 else 2,
+                 weight=i / 2.0, flying=i > 2,
+                 born=datetime.datetime(2017, 1, 1 + i))
+            for i in range(5)])
+
+    def tearDown(self):
+        self.reg.destroy()
+
+    def test_read_columns(self):
+        arrays = self.reg.read_columns(
+            'animal', 'bird',
+            ['id', 'name', 'nb_wings', 'weight', 'flying', 'born'],
+            chunk_size=2)
+        self.assertEqual(arrays['id'].dtype, numpy.int64)
+        self.assertEqual(arrays['weight'].dtype, numpy.float64)
+        self.assertEqual(arrays['flying'].tolist(),
+                         [False, False, False, True, True])
+        self.assertEqual(arrays['name'].dtype, object)
+        self.assertEqual(arrays['nb_wings'].dtype, numpy.int64)
+        self.assertEqual(arrays['nb_wings'].mask.tolist(),
+                         [False, True, False, True, False])
+        self.assertEqual(arrays['nb_wings'].sum(), 6)
+        self.assertEqual(arrays['born'][0],
+                         numpy.datetime64('2017-01-01T00:00:00'))
+
+    def test_null_in_mandatory_column(self):
+        # nb_wings made mandatory after NULL values were written
+        engine = self.reg.session.get_bind()
+        engine.execute("update dynalchemy_column set nullable = 0 "
+                       "where name = 'nb_wings'")
+        reg = Registry(declarative_base(bind=engine),
+                       sessionmaker(bind=engine)())
+        arrays = reg.read_columns('animal', 'bird', ['nb_wings', 'weight'],
+                                  chunk_size=2)
+        self.assertEqual(arrays['nb_wings'].mask.tolist(),
+                         [False, True, False, True, False])
+        self.assertEqual(arrays['nb_wings'].sum(), 6)
+        self.assertNotIsInstance(arrays['weight'], numpy.ma.MaskedArray)
+
+    def test_where(self):
+        Bird = self.reg.get('animal', 'bird')
+        arrays = self.reg.read_columns('animal', 'bird', ['weight'],
+                                       where=Bird.weight > 1)
+        self.assertEqual(arrays['weight'].tolist(), [1.5, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
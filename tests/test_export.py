@@ -0,0 +1,79 @@
+import datetime
+import io
+import json
+import unittest
+from decimal import Decimal
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='size', kind='Enum', choices=['small', 'big'],
+                 nullable=True),
+            dict(name='born', kind='DateTime', nullable=True),
+            dict(name='picture', kind='LargeBinary', nullable=True),
+            dict(name='weight', kind='Numeric', nullable=True),
+        ])
+        self.reg.bulk_insert('animal', 'bird', [
+            dict(name='pinson', size='small',
+                 born=datetime.datetime(2017, 3, 13, 9, 24),
+                 picture=b'\x00\x01', weight='21.5'),
+            dict(name='merle'),
+        ])
+
+    def tearDown(self):
+        self.reg.destroy()
+
+    def _roundtrip(self, fmt):
+        out = io.StringIO()
+        self.assertEqual(self.reg.export('animal', 'bird', fmt, out,
+                                         batch_size=1), 2)
+        self.reg.add('animal', 'bird2', columns=[
+            dict(name='name', kind='String'),
+            dict(name='size', kind='Enum', choices=['small', 'big'],
+                 nullable=True),
+            dict(name='born', kind='DateTime', nullable=True),
+            dict(name='picture', kind='LargeBinary', nullable=True),
+            dict(name='weight', kind='Numeric', nullable=True),
+        ])
+        counts = self.reg.import_rows('animal', 'bird2', fmt,
+                                      io.StringIO(out.getvalue()))
+        self.assertEqual(counts, [2])
+        Bird2 = self.reg.get('animal', 'bird2')
+        birds = self.reg.session.query(Bird2).order_by(Bird2.id).all()
+        self.assertEqual(birds[0].born, datetime.datetime(2017, 3, 13, 9, 24))
+        self.assertEqual(birds[0].picture, b'\x00\x01')
+        self.assertEqual(birds[0].size, 'small')
+        self.assertEqual(birds[0].weight, Decimal('21.5'))
+        self.assertIsNone(birds[1].picture)
+        return out.getvalue()
+
+    def test_csv(self):
+        data = self._roundtrip('csv')
+        self.assertEqual(data.splitlines()[0], 'id,name,size,born,picture,weight')
+
+    def test_jsonl(self):
+        data = self._roundtrip('jsonl')
+        first = json.loads(data.splitlines()[0])
+        self.assertEqual(first['born'], '2017-03-13T09:24:00')
+        self.assertEqual(first['picture'], 'AAE=')
+        self.assertEqual(Decimal(first['weight']), Decimal('21.5'))
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, self.reg.export, 'animal', 'bird',
+                          'xml', io.StringIO())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,18 @@
 
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Integer
+from sqlalchemy import create_engine, event, inspect, Integer
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.schema import CreateIndex
 
 from dynalchemy import Registry
+from dynalchemy.meta import InvalidDefinitionException, TableExistException
 from dynalchemy.models import DTable, DColumn
 
 import logging
@@ -62,12 +69,169 @@ class TestRegistry(unittest.TestCase):
         Bird3 = self._create_bird(collection='zoo')
         self.assertEqual(self.reg.list('animal'), [Bird, Bird2])
 
+    def test_add_many(self):
+        engine = self.reg.session.get_bind()
+        commits = []
+        listener = lambda *args: commits.append(args)
+        event.listen(engine, 'commit', listener)
+        try:
+            Seed, Bird = self.reg.add_many([
+                {'collection': 'food', 'name': 'seed', 'columns': [
+                    dict(name='name', kind='String'),
+                    dict(name='predators', kind='Relation',
+                         relation=dict(collection='animal', name='bird',
+                                       cardinality='many')),
+                ]},
+                {'collection': 'animal', 'name': 'bird', 'columns': [
+                    dict(name='name', kind='String'),
+                ]},
+            ])
+        finally:
+            event.remove(engine, 'commit', listener)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(Seed.predators.property.target, Bird.__table__)
+        self.assertIn('food__seed__bird__association', self.base.metadata.tables)
+
+        session = self.reg.session
+        session.add(Seed(name='corn', predators=[Bird(name='pinson')]))
+        session.commit()
+        self.assertEqual(session.query(Seed).one().predators[0].name, 'pinson')
+
+    def test_add_many_invalid(self):
+        self.assertRaises(InvalidDefinitionException, self.reg.add_many, [
+            {'collection': 'animal', 'name': 'bird'},
+            {'collection': 'animal', 'name': 'cat', 'columns': [
+                dict(name='size', kind='Enum')]},
+        ])
+        self.assertRaises(InvalidDefinitionException, self.reg.add_many, [
+            {'collection': 'animal', 'name': 'bird', 'columns': [
+                dict(name='food', kind='Relation',
+                     relation=dict(collection='food', name='seed',
+                                   cardinality='one'))]},
+        ])
+        self.assertEqual(self.reg.list('animal'), [])
+        self.assertEqual(self.reg.session.query(DTable).count(), 0)
+
     def test_add_column(self):
         self._create_bird()
         self.reg.add_column('animal', 'bird', dict(name='extra', kind='String'))
         Bird = self.reg.get('animal', 'bird')
         self.assertTrue(hasattr(Bird, 'extra'))
 
+    def test_add_columns(self):
+        self._create_bird()
+        engine = self.reg.session.get_bind()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            self.reg.add_columns('animal', 'bird', [
+                dict(name='extra', kind='String'),
+                dict(name='weight', kind='Float', default='1.5'),
+            ])
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        alters = [s for s in statements if s.startswith('alter')]
+        self.assertEqual(len(alters), 2)
+
+        Bird = self.reg.get('animal', 'bird')
+        self.reg.session.add(Bird(name='pinson', extra='x'))
+        self.reg.session.commit()
+        self.assertEqual(self.reg.session.query(Bird).one().weight, 1.5)
+
+        self.assertRaises(InvalidDefinitionException, self.reg.add_columns,
+                          'animal', 'bird', [dict(name='extra2'),
+                                             dict(name='extra2')])
+        table = self.reg._get_dtable('animal', 'bird')
+        self.assertEqual(len(table.get_columns()), 5)
+
+    def test_bulk_insert(self):
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String', nullable=False),
+            dict(name='nb_wings', kind='Integer', default='2'),
+            dict(name='flying', kind='Boolean', nullable=True),
+            dict(name='born', kind='Date', nullable=True),
+        ])
+        rows = ({'name': 'bird%d' % i, 'flying': 'true', 'born': '2017-03-13'}
+                for i in range(25))
+        counts = self.reg.bulk_insert('animal', 'bird', rows, chunk_size=10)
+        self.assertEqual(counts, [10, 10, 5])
+        self.reg.bulk_insert('animal', 'bird', [{'name': 'x', 'nb_wings': '4'}])
+
+        Bird = self.reg.get('animal', 'bird')
+        birds = self.reg.session.query(Bird).order_by(Bird.id).all()
+        self.assertEqual(len(birds), 26)
+        self.assertEqual(birds[0].nb_wings, 2)
+        self.assertEqual(birds[0].flying, True)
+        self.assertEqual(birds[0].born.year, 2017)
+        self.assertEqual(birds[-1].nb_wings, 4)
+        self.assertIsNone(birds[-1].born)
+
+        self.assertRaises(KeyError, self.reg.bulk_insert, 'animal', 'bird',
+                          [{'name': 'x', 'unknown': 1}])
+        for row in ({'flying': 'banana'}, {'nb_wings': 3.7}):
+            self.assertRaises(ValueError, self.reg.bulk_insert, 'animal',
+                              'bird', [dict(row, name='x')])
+        self.assertEqual(self.reg.session.query(Bird).count(), 26)
+
+    def _index_names(self, tablename):
+        engine = self.reg.session.get_bind()
+        return sorted(
+            (index['name'], tuple(index['column_names']), bool(index['unique']))
+            for index in inspect(engine).get_indexes(tablename))
+
+    def test_indexes(self):
+        self.reg.add('food', 'seed', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String', unique=True),
+            dict(name='color', kind='String', index=True),
+            dict(name='nb_wings', kind='Integer'),
+            dict(name='seed', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='one')),
+            dict(name='seeds', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='many', backref='eaters')),
+        ], indexes=[dict(columns=['color', 'nb_wings'])])
+        self.assertEqual(self._index_names('animal__bird'), [
+            ('cix_animal__bird_color_nb_wings', ('color', 'nb_wings'), False),
+            ('ix_animal__bird_color', ('color',), False),
+            ('ix_animal__bird_name', ('name',), True),
+            ('ix_animal__bird_seed__id', ('seed__id',), False),
+        ])
+        self.assertEqual(
+            [name for name, _, _ in
+             self._index_names('animal__bird__seed__association')],
+            ['ix_animal__bird__seed__association_bird__id',
+             'ix_animal__bird__seed__association_seed__id'])
+
+        self.reg.add_column('animal', 'bird',
+                            dict(name='code', kind='String', index=True))
+        self.reg.add_index('animal', 'bird', ['name', 'code'], unique=True,
+                           index_name='bird_name_code')
+        names = [name for name, _, _ in self._index_names('animal__bird')]
+        self.assertIn('ix_animal__bird_code', names)
+        self.assertIn('bird_name_code', names)
+
+        # distinct from the index of the column
+        self.reg.add_index('animal', 'bird', ['color'])
+        self.assertEqual(
+            [columns for name, columns, _ in self._index_names('animal__bird')
+             if columns == ('color',)], [('color',), ('color',)])
+        # shortened where the dialect limits identifiers
+        Obs = self.reg.add('animal', 'observation_%s' % ('x' * 40), columns=[
+            dict(name='station_code', kind='String'),
+            dict(name='observed_on', kind='Date'),
+        ], indexes=[dict(columns=['station_code', 'observed_on'])])
+        for index in Obs.__table__.indexes:
+            ddl = str(CreateIndex(index).compile(
+                dialect=postgresql.dialect()))
+            self.assertLessEqual(len(ddl.split()[2]), 63)
+        self.assertRaises(InvalidDefinitionException, self.reg.add_index,
+                          'animal', 'bird', ['unknown'])
+
     def test_add_parent_relation(self):
         Bird = self._create_bird()
         food = self.reg.add('food', 'food', columns=[
@@ -94,6 +258,424 @@ class TestRegistry(unittest.TestCase):
         Bird = self.reg.get('animal', 'bird')
         self.assertEqual(Bird.foods.property.target, food.__table__)
 
+    def test_load_all_bulk(self):
+        self.reg.add('food', 'seed', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='seed', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='one')),
+            dict(name='seeds', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='many', backref='eaters')),
+        ])
+        self.reg.add('animal', 'cat')
+        self.reg.deprecate('animal', 'cat')
+
+        engine = self.reg.session.get_bind()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            base = declarative_base(bind=engine)
+            reg = Registry(base, sessionmaker(bind=engine)())
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        selects = [s for s in statements if s.startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
+        self.assertIn('animal__bird', base._decl_class_registry)
+        self.assertNotIn('animal__cat', base._decl_class_registry)
+        Bird = reg.get('animal', 'bird')
+        self.assertEqual(Bird.seeds.property.target.name, 'food__seed')
+
+    def test_lazy(self):
+        self.reg.add('food', 'seed', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='seeds', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='many', backref='eaters')),
+        ])
+
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        reg = Registry(base, sessionmaker(bind=engine)(), lazy=True)
+        self.assertEqual(len(base._decl_class_registry), 0)
+
+        Bird = reg.get('animal', 'bird')
+        self.assertIn('food__seed', base._decl_class_registry)
+        self.assertEqual(Bird.seeds.property.target.name, 'food__seed')
+        self.assertEqual(reg.list('animal')[0], Bird)
+
+    def test_snapshot(self):
+        self.reg.add('food', 'seed', columns=[
+            dict(name='name', kind='String'),
+            dict(name='size', kind='Enum', choices=['small', 'big']),
+        ])
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='seed', kind='Relation',
+                relation=dict(collection='food', name='seed',
+                              cardinality='one')),
+        ])
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'catalog.json')
+        engine = self.reg.session.get_bind()
+
+        def start():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(engine, 'before_cursor_execute', listener)
+            try:
+                base = declarative_base(bind=engine)
+                reg = Registry(base, sessionmaker(bind=engine)(),
+                               snapshot=path)
+            finally:
+                event.remove(engine, 'before_cursor_execute', listener)
+            selects = [s for s in statements if s.startswith('SELECT')]
+            return reg, len(selects)
+
+        reg, nb_selects = start()
+        self.assertEqual(nb_selects, 3)
+        self.assertTrue(os.path.exists(path))
+
+        reg, nb_selects = start()
+        self.assertEqual(nb_selects, 1)
+        Seed = reg.get('food', 'seed')
+        self.assertEqual(Seed.size.property.columns[0].type.enums,
+                         ['small', 'big'])
+        Bird = reg.get('animal', 'bird')
+        self.assertEqual(Bird.seed.property.target.name, 'food__seed')
+
+        # outdated snapshot is ignored and rewritten
+        reg.deprecate('animal', 'bird')
+        reg, nb_selects = start()
+        self.assertEqual(nb_selects, 3)
+        self.assertEqual(reg.list('animal'), [])
+
+    def test_catalog(self):
+        self._create_bird()
+        self._create_bird(name='bird2')
+        self.reg.deprecate('animal', 'bird2')
+        self.assertRaises(TableExistException, self._create_bird)
+        self.assertRaises(TableExistException, self._create_bird,
+                          name='bird2')
+
+        engine = self.reg.session.get_bind()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            self.base._decl_class_registry.pop('animal__bird', None)
+            Bird = self.reg.get('animal', 'bird')
+            self.assertEqual(self.reg.list('animal'), [Bird])
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+
+    def test_deprecate_column(self):
+        self._create_bird()
+        self.reg.deprecate_column('animal', 'bird', 'color')
+        table = self.reg._get_dtable('animal', 'bird')
+        self.assertEqual([c.name for c in table.get_columns()],
+                         ['name', 'nb_wings'])
+
+        base = declarative_base(bind=self.reg.session.get_bind())
+        reg = Registry(base, sessionmaker(bind=base.metadata.bind)())
+        self.assertFalse(hasattr(reg.get('animal', 'bird'), 'color'))
+
+    def test_refresh(self):
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        other = Registry(base, sessionmaker(bind=engine)())
+        self.assertEqual(other.refresh(), [])
+
+        self._create_bird()
+        self.assertEqual(other.refresh(), [('animal', 'bird')])
+        self.assertEqual(other.get('animal', 'bird').__tablename__,
+                         'animal__bird')
+        self.assertEqual(self.reg.refresh(), [])
+
+        self.reg.add_column('animal', 'bird',
+                            dict(name='extra', kind='String'))
+        self.assertEqual(other.refresh(), [('animal', 'bird')])
+        self.assertTrue(hasattr(other.get('animal', 'bird'), 'extra'))
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            self.assertEqual(other.refresh(), [])
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 1)
+
+        self.reg.deprecate('animal', 'bird')
+        self.assertEqual(other.refresh(), [('animal', 'bird')])
+        self.assertEqual(other.list('animal'), [])
+
+    def test_refresh_indexes(self):
+        engine = self.reg.session.get_bind()
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='x', kind='String'),
+            dict(name='y', kind='String'),
+        ])
+        other = Registry(declarative_base(bind=engine),
+                         sessionmaker(bind=engine)())
+        Bird = other.get('animal', 'bird')
+
+        self.reg.add_index('animal', 'bird', ['x'])
+        self.assertEqual(other.refresh(), [('animal', 'bird')])
+        self.assertIs(other.get('animal', 'bird'), Bird)
+        self.assertEqual([index.name for index in Bird.__table__.indexes],
+                         ['cix_animal__bird_x'])
+        other.add_index('animal', 'bird', ['y'])
+        self.assertEqual(self.reg.refresh(), [('animal', 'bird')])
+        self.assertEqual(other.refresh(), [])
+
+        fresh = Registry(declarative_base(bind=engine),
+                         sessionmaker(bind=engine)())
+        self.assertEqual(
+            [index['columns']
+             for index in fresh._get_dtable('animal', 'bird').indexes],
+            [['x'], ['y']])
+        self.assertEqual(
+            sorted(index.name for index in self.reg.get('animal', 'bird')
+                   .__table__.indexes),
+            ['cix_animal__bird_x', 'cix_animal__bird_y'])
+
+    def test_refresh_relations(self):
+        engine = self.reg.session.get_bind()
+        self.reg.add('food', 'food', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='food', kind='Relation', relation=dict(
+                collection='food', name='food', cardinality='one',
+                backref='birds')),
+        ])
+        base = declarative_base(bind=engine)
+        other = Registry(base, sessionmaker(bind=engine)())
+        Bird = other.get('animal', 'bird')
+
+        self.reg.add_column('animal', 'bird',
+                            dict(name='color', kind='String'))
+        self.reg.deprecate_column('animal', 'bird', 'name')
+        self.assertEqual(other.refresh(), [('animal', 'bird')])
+        self.assertIs(other.get('animal', 'bird'), Bird)
+
+        session = other.session
+        session.add(Bird(color='red', food=other.get('food', 'food')(
+            name='corn')))
+        session.commit()
+        self.assertEqual(session.query(Bird).one().food.birds[0].color,
+                         'red')
+
+        self.reg.deprecate_column('animal', 'bird', 'color')
+        Bird = self.reg.get('animal', 'bird')
+        self.assertEqual(self.reg.session.query(Bird).one().food.name,
+                         'corn')
+
+    def test_upgrade_meta_tables(self):
+        engine = create_engine('sqlite:///:memory:')
+        engine.execute('create table dynalchemy_table (id integer primary key,'
+                       ' collection varchar, name varchar, schema varchar,'
+                       ' active boolean)')
+        engine.execute('create table dynalchemy_column (id integer primary '
+                       'key, table_id integer, name varchar, kind varchar, '
+                       'active boolean, nullable boolean, "default" varchar,'
+                       ' length integer, choices blob, precision integer, '
+                       'relation blob)')
+        engine.execute("insert into dynalchemy_table values "
+                       "(1, 'animal', 'bird', null, 1)")
+        engine.execute('create table animal__bird (id integer primary key)')
+
+        base = declarative_base(bind=engine)
+        reg = Registry(base, sessionmaker(bind=engine)())
+        self.assertEqual(reg.get('animal', 'bird').__tablename__,
+                         'animal__bird')
+        reg.add_column('animal', 'bird', dict(name='name', kind='String'))
+        self.assertEqual(reg.generation, 0)
+        self.assertEqual(reg.refresh(), [])
+        self.assertEqual(reg.generation, 1)
+
+    def test_migrate_pickled_catalog(self):
+        engine = create_engine('sqlite:///:memory:')
+        engine.execute('create table dynalchemy_table (id integer primary key,'
+                       ' collection varchar, name varchar, schema varchar,'
+                       ' active boolean, unique_keys blob)')
+        engine.execute('create table dynalchemy_column (id integer primary '
+                       'key, table_id integer, name varchar, kind varchar, '
+                       'active boolean, nullable boolean, "default" varchar,'
+                       ' length integer, choices blob, precision integer, '
+                       'relation blob)')
+        engine.execute("insert into dynalchemy_table values "
+                       "(1, 'animal', 'bird', null, 1, null), "
+                       "(2, 'animal', 'egg', null, 1, ?)",
+                       pickle.dumps([['size']]))
+        engine.execute(
+            "insert into dynalchemy_column (id, table_id, name, kind, active,"
+            " nullable, choices, relation) values "
+            "(1, 2, 'size', 'Enum', 1, 1, ?, null), "
+            "(2, 2, 'bird', 'Relation', 1, 1, null, ?)",
+            pickle.dumps(['small', 'big']),
+            pickle.dumps({'collection': 'animal', 'name': 'bird',
+                          'cardinality': 'one', 'backref': 'eggs'}))
+        engine.execute('create table animal__bird (id integer primary key)')
+        engine.execute('create table animal__egg (id integer primary key, '
+                       'size varchar, bird__id integer)')
+
+        base = declarative_base(bind=engine)
+        session = sessionmaker(bind=engine)()
+        reg = Registry(base, session)
+        Bird = reg.get('animal', 'bird')
+        Egg = reg.get('animal', 'egg')
+        session.add(Egg(size='small', bird=Bird()))
+        session.commit()
+        self.assertEqual(len(session.query(Bird).one().eggs), 1)
+
+        egg = reg._get_dtable('animal', 'egg')
+        self.assertEqual(egg.unique_keys, [['size']])
+        self.assertEqual(egg.get_columns()[0].choices, ['small', 'big'])
+        self.assertEqual(session.query(DColumn).filter_by(
+            target_collection='animal', target_name='bird').count(), 1)
+        raw = engine.execute('select relation from dynalchemy_column '
+                             'where id = 2').scalar()
+        self.assertEqual(raw[:1], b'{')
+        # foreign keys of the tables created before they were indexed
+        self.assertEqual(
+            [(index['name'], index['column_names'])
+             for index in inspect(engine).get_indexes('animal__egg')],
+            [('ix_animal__egg_bird__id', ['bird__id'])])
+
+    def test_deferred(self):
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        reg = Registry(base, sessionmaker(bind=engine)(), defer_blobs=True)
+        Doc = reg.add('archive', 'doc', columns=[
+            dict(name='name', kind='String'),
+            dict(name='body', kind='Text', nullable=True),
+            dict(name='summary', kind='Text', deferred=False),
+            dict(name='width', kind='Integer', deferred_group='size'),
+            dict(name='height', kind='Integer', deferred_group='size'),
+        ])
+        reg.add_column('archive', 'doc', dict(name='scan', kind='LargeBinary'))
+
+        deferred = dict((prop.key, prop.deferred)
+                        for prop in inspect(Doc).column_attrs)
+        self.assertEqual(deferred, dict(
+            id=False, name=False, body=True, summary=False, width=True,
+            height=True, scan=True))
+        self.assertEqual(inspect(Doc).attrs.width.group, 'size')
+
+        reg.session.add(Doc(name='report', body='x' * 1000, width=1,
+                            height=2))
+        reg.session.commit()
+        reg.session.expunge_all()
+        doc = reg.session.query(Doc).one()
+        self.assertNotIn('body', doc.__dict__)
+        self.assertEqual(doc.width, 1)
+        self.assertIn('height', doc.__dict__)
+        self.assertEqual(len(doc.body), 1000)
+
+        # the application registry does not defer blobs
+        self.assertFalse(inspect(self.reg.get('archive', 'doc'))
+                         .attrs.body.deferred)
+
+    def test_max_models(self):
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        session = sessionmaker(bind=engine)()
+        reg = Registry(base, session, max_models=2)
+        reg.add('animal', 'bird', columns=[dict(name='name', kind='String')])
+        reg.add('animal', 'cat', columns=[dict(name='name', kind='String')])
+        reg.get('animal', 'bird')
+        reg.add('animal', 'dog', columns=[dict(name='name', kind='String')])
+
+        self.assertNotIn('animal__cat', base.metadata.tables)
+        self.assertEqual(list(reg._resident),
+                         [('animal', 'bird'), ('animal', 'dog')])
+
+        Cat = reg.get('animal', 'cat')
+        session.add(Cat(name='felix'))
+        session.commit()
+        self.assertEqual(session.query(Cat).one().name, 'felix')
+        self.assertNotIn('animal__bird', base.metadata.tables)
+
+        # related models are evicted together
+        reg.add('food', 'seed', columns=[
+            dict(name='predator', kind='Relation',
+                 relation=dict(collection='animal', name='cat',
+                               cardinality='one', backref='seeds')),
+        ])
+        reg.get('animal', 'dog')
+        self.assertNotIn('animal__cat', base.metadata.tables)
+        self.assertNotIn('food__seed', base.metadata.tables)
+        self.assertEqual(list(reg._resident), [('animal', 'dog')])
+
+        Seed = reg.get('food', 'seed')
+        session.add(Seed(predator=session.query(reg.get('animal', 'cat'))
+                         .one()))
+        session.commit()
+        self.assertEqual(len(session.query(Seed).one().predator.seeds), 1)
+
+    def test_max_models_related(self):
+        self.reg.add_many([
+            dict(collection='x', name='parent%d' % i)
+            for i in range(10)] + [
+            dict(collection='x', name='child%d' % i, columns=[
+                dict(name='parent', kind='Relation',
+                     relation=dict(collection='x', name='parent%d' % i,
+                                   cardinality='one', backref='children')),
+            ]) for i in range(10)])
+
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        session = sessionmaker(bind=engine)()
+        reg = Registry(base, session, lazy=True, max_models=2)
+        for i in list(range(10)) * 2:
+            Child = reg.get('x', 'child%d' % i)
+            self.assertLessEqual(len(reg._resident), 2)
+            session.add(Child(parent=reg.get('x', 'parent%d' % i)()))
+            session.commit()
+            self.assertLessEqual(len(reg._resident), 2)
+        self.assertEqual(len(base.metadata.tables), 2)
+        Parent = reg.get('x', 'parent9')
+        self.assertEqual([len(parent.children)
+                          for parent in session.query(Parent)], [1, 1])
+
+    def test_max_models_nested_build(self):
+        self.reg.add_many([
+            {'collection': 'x', 'name': 'a', 'columns': [
+                dict(name='c', kind='Relation',
+                     relation=dict(collection='x', name='c',
+                                   cardinality='one')),
+                dict(name='b', kind='Relation',
+                     relation=dict(collection='x', name='b',
+                                   cardinality='one')),
+            ]},
+            {'collection': 'x', 'name': 'b'},
+            {'collection': 'x', 'name': 'c'},
+        ])
+
+        # targets of a are built while a is, none of them is evicted
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        session = sessionmaker(bind=engine)()
+        reg = Registry(base, session, lazy=True, max_models=1)
+        A = reg.get('x', 'a')
+        self.assertEqual(sorted(reg._resident),
+                         [('x', 'a'), ('x', 'b'), ('x', 'c')])
+        session.add(A(c=reg.get('x', 'c')(), b=reg.get('x', 'b')()))
+        session.commit()
+        self.assertIsNotNone(session.query(A).one().c)
+
     # def test_backref(self):
     #     Food = self.reg.add('food', 'food', columns=[
     #         dict(name='name', kind='String', nullable=False),
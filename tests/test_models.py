@@ -1,13 +1,13 @@
 from sqlalchemy import Column, Integer, String, Enum
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, joinedload
 from dynalchemy import Registry
 
 import unittest
 import sqlalchemy
 
-from dynalchemy.models import DColumn
+from dynalchemy.models import DColumn, InvalidDefinitionException, Relation
 
 
 class TestDColumn(unittest.TestCase):
@@ -96,6 +96,37 @@ class TestDColumn(unittest.TestCase):
             relation={'collection': 'animal'})
         self.assertTrue(col.is_relationship())
 
+    def test_validate(self):
+
+        DColumn(name='bob', kind='Enum', choices=['a']).validate()
+        DColumn(name='rel', kind='Relation', relation={
+            'collection': 'animal', 'name': 'bird',
+            'cardinality': 'many'}).validate()
+        for col in (DColumn(kind='String'),
+                    DColumn(name='bob', kind='Unknown'),
+                    DColumn(name='bob', kind='Enum'),
+                    DColumn(name='bob', kind='Integer', default='abc'),
+                    DColumn(name='rel', kind='Relation',
+                            relation={'collection': 'animal'})):
+            self.assertRaises(InvalidDefinitionException, col.validate)
+
+    def test_relation(self):
+
+        col = DColumn(name='rel', kind='Relation', relation={
+            'collection': 'animal', 'name': 'bird', 'cardinality': 'one'})
+        self.assertIsInstance(col.relation, Relation)
+        self.assertEqual(
+            (col.relation.cardinality, col.relation.name, col.relation.backref),
+            ('one', 'bird', None))
+        self.assertEqual((col.target_collection, col.target_name),
+                         ('animal', 'bird'))
+        self.assertEqual(col.relation.to_dict(), {
+            'collection': 'animal', 'name': 'bird', 'cardinality': 'one'})
+        self.assertRaises(AttributeError, setattr, col.relation, 'name', 'x')
+        self.assertRaises(InvalidDefinitionException, DColumn,
+                          name='rel', kind='Relation',
+                          relation={'type': 'parent'})
+
     # def test_get_parent_relationship(self):
 
     #     engine = create_engine('sqlite:///:memory:', echo=False)
@@ -195,6 +226,74 @@ class TestDTable(unittest.TestCase):
         corn = self.reg.session.query(Seed).filter_by(name='corn').one()
         self.assertEqual(len(corn.predators), 2)
 
+    def test_relationship_lazy(self):
+
+        Bird = self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+        ])
+        Seed = self.reg.add('food', 'seed', columns=[
+            dict(name='name', kind='String'),
+            dict(name='predators', kind='Relation', relation={
+                'collection': 'animal', 'name': 'bird',
+                'cardinality': 'many', 'backref': 'seeds',
+                'lazy': 'selectin', 'backref_lazy': 'dynamic'}),
+        ])
+        session = self.reg.session
+        for i in range(5):
+            session.add(Seed(name='seed%d' % i, predators=[
+                Bird(name='bird%d' % i), Bird(name='other%d' % i)]))
+        session.commit()
+        session.expunge_all()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        engine = session.get_bind()
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            seeds = session.query(Seed).all()
+            self.assertEqual(
+                sum(len(seed.predators) for seed in seeds), 10)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(
+            session.query(Bird).first().seeds.filter_by(name='seed0').count(),
+            1)
+
+        self.assertRaises(InvalidDefinitionException, DColumn(
+            name='rel', kind='Relation', relation={
+                'collection': 'animal', 'name': 'bird',
+                'cardinality': 'one', 'lazy': 'dynamic'}).validate)
+        self.assertRaises(InvalidDefinitionException, DColumn(
+            name='rel', kind='Relation', relation={
+                'collection': 'animal', 'name': 'bird',
+                'cardinality': 'one', 'lazy': 'eager'}).validate)
+
+    def test_relationship_lazy_default(self):
+
+        engine = self.reg.session.get_bind()
+        base = declarative_base(bind=engine)
+        reg = Registry(base, sessionmaker(bind=engine)(),
+                       relation_lazy='raise')
+        Bird = reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+        ])
+        Egg = reg.add('animal', 'egg', columns=[
+            dict(name='bird', kind='Relation', relation={
+                'collection': 'animal', 'name': 'bird',
+                'cardinality': 'one', 'backref': 'eggs',
+                'backref_lazy': 'joined'}),
+        ])
+        reg.session.add(Egg(bird=Bird(name='pinson')))
+        reg.session.commit()
+        reg.session.expunge_all()
+
+        bird = reg.session.query(Bird).one()
+        self.assertEqual(len(bird.eggs), 1)
+        self.assertRaises(sqlalchemy.exc.InvalidRequestError,
+                          getattr, bird.eggs[0], 'bird')
+        base.metadata.drop_all()
+
     def test_relationship_external(self):
 
         class Specie(self.reg._base):
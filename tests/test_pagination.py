@@ -0,0 +1,101 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.meta import InvalidDefinitionException
+
+
+class TestPagination(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.Bird = self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+            dict(name='born', kind='Date', index=True),
+        ])
+        self.reg.bulk_insert('animal', 'bird', [
+            dict(name='bird%02d' % i,
+                 born=datetime.date(2020, 1, 1 + i // 3))
+            for i in range(25)])
+
+    def tearDown(self):
+        self.base.metadata.drop_all()
+
+    def _walk(self, **kwargs):
+        names = []
+        token = None
+        while True:
+            page = self.reg.paginate('animal', 'bird', token, **kwargs)
+            names.append([bird.name for bird in page.items])
+            token = page.next_token
+            if token is None:
+                return names
+
+    def test_paginate(self):
+        pages = self._walk(page_size=10)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), ['bird%02d' % i for i in range(25)])
+
+        pages = self._walk(page_size=4, order_by=['born'])
+        self.assertEqual(sum(pages, []), ['bird%02d' % i for i in range(25)])
+
+        query = self.reg.session.query(self.Bird).filter(
+            self.Bird.name >= 'bird20')
+        self.assertEqual(self._walk(page_size=3, query=query),
+                         [['bird20', 'bird21', 'bird22'], ['bird23', 'bird24']])
+
+    def test_numeric_key(self):
+        Egg = self.reg.add('animal', 'egg', columns=[
+            dict(name='weight', kind='Numeric', index=True),
+        ])
+        self.reg.bulk_insert('animal', 'egg', [
+            dict(weight='%d.25' % (i // 2)) for i in range(5)])
+        paginator = self.reg.paginator('animal', 'egg', ['weight'])
+        page = paginator.page(page_size=3)
+        self.assertEqual(paginator.decode(page.next_token),
+                         [Decimal('1.25'), 3])
+        self.assertIsInstance(paginator.decode(page.next_token)[0], Decimal)
+        ids = [egg.id for egg in page.items]
+        ids += [egg.id for egg in paginator.page(page.next_token, 3).items]
+        self.assertEqual(ids, [egg.id for egg in self.reg.session.query(Egg)
+                               .order_by(Egg.weight, Egg.id)])
+
+    def test_seek(self):
+        paginator = self.reg.paginator('animal', 'bird', ['born'])
+        token = paginator.page(page_size=20).next_token
+        statements = []
+        listener = lambda *args: statements.append(args[2:4])
+        engine = self.reg.session.get_bind()
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            page = paginator.page(token, page_size=20)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(page.items), 5)
+        # the sqlite dialect always renders an OFFSET, kept to 0
+        sql, params = statements[0]
+        self.assertIn('animal__bird.born > ?', sql)
+        self.assertEqual(params[-1], 0)
+
+        self.assertRaises(ValueError, paginator.page, 'garbage')
+        self.assertRaises(ValueError, self.reg.paginate, 'animal', 'bird',
+                          token)
+        self.assertRaises(InvalidDefinitionException, self.reg.paginator,
+                          'animal', 'bird', ['name'])
+
+    def test_iterate(self):
+        batches = list(self.reg.iterate('animal', 'bird', batch_size=10))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(list(self.reg.iterate('animal', 'bird', query=(
+            self.reg.session.query(self.Bird).filter_by(name='none')))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
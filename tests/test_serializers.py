@@ -0,0 +1,102 @@
+import datetime
+import json
+import unittest
+from decimal import Decimal
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+
+
+class TestRowSerializer(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String'),
+        ])
+        self.Egg = self.reg.add('animal', 'egg', columns=[
+            dict(name='size', kind='Enum', choices=['small', 'big']),
+            dict(name='laid', kind='DateTime'),
+            dict(name='dna', kind='LargeBinary'),
+            dict(name='weight', kind='Numeric'),
+            dict(name='bird', kind='Relation', relation=dict(
+                collection='animal', name='bird', cardinality='one')),
+        ])
+
+    def tearDown(self):
+        self.base.metadata.drop_all()
+
+    def test_serialize(self):
+        Bird = self.reg.get('animal', 'bird')
+        session = self.reg.session
+        session.add(self.Egg(size='small', dna=b'ACGT', weight=Decimal('1.5'),
+                             laid=datetime.datetime(2020, 5, 1, 12),
+                             bird=Bird(name='pinson')))
+        session.add(self.Egg(size='big'))
+        session.commit()
+
+        serializer = self.reg.serializer('animal', 'egg')
+        self.assertEqual(serializer.fields, [
+            'id', 'size', 'laid', 'dna', 'weight', 'bird__id'])
+        eggs = session.query(self.Egg).order_by(self.Egg.id).all()
+        expected = [
+            dict(id=1, size='small', laid='2020-05-01T12:00:00', dna='QUNHVA==',
+                 weight=1.5, bird__id=1),
+            dict(id=2, size='big', laid=None, dna=None, weight=None,
+                 bird__id=None)]
+        self.assertEqual(serializer.to_dict(eggs[0]), expected[0])
+        self.assertEqual(json.loads(serializer.to_json(eggs[1])), expected[1])
+        self.assertEqual(json.loads(serializer.to_json_many(eggs)), expected)
+
+        rows = session.execute(
+            select([self.Egg.__table__]).order_by(self.Egg.id))
+        self.assertEqual(serializer.to_dicts(rows), expected)
+
+    def test_deferred(self):
+        engine = self.reg.session.get_bind()
+        session = sessionmaker(bind=engine)()
+        reg = Registry(declarative_base(bind=engine), session,
+                       defer_blobs=True)
+        Egg = reg.get('animal', 'egg')
+        session.add_all([Egg(size='small', dna=b'ACGT') for _ in range(6)])
+        session.commit()
+        eggs = session.query(Egg).all()
+
+        serializer = reg.serializer('animal', 'egg')
+        self.assertEqual(serializer.fields, [
+            'id', 'size', 'laid', 'weight', 'bird__id'])
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            serializer.to_dicts(eggs)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+
+        serializer = reg.serializer('animal', 'egg', ['size', 'dna'])
+        self.assertIs(reg.serializer('animal', 'egg', ['size', 'dna']),
+                      serializer)
+        self.assertEqual(serializer.to_dict(eggs[0]),
+                         dict(id=eggs[0].id, size='small', dna='QUNHVA=='))
+        self.assertRaises(KeyError, reg.serializer, 'animal', 'egg',
+                          ['color'])
+
+    def test_cache(self):
+        serializer = self.reg.serializer('animal', 'bird')
+        self.assertIs(self.reg.serializer('animal', 'bird'), serializer)
+        self.reg.add_column('animal', 'bird', dict(name='color', kind='String'))
+        self.assertEqual(self.reg.serializer('animal', 'bird').fields,
+                         ['id', 'name', 'color'])
+        self.reg.deprecate_column('animal', 'bird', 'name')
+        self.assertEqual(self.reg.serializer('animal', 'bird').fields,
+                         ['id', 'color'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.stats import BUCKETS, Stats
+
+
+class TestStats(unittest.TestCase):
+
+    def test_snapshot(self):
+        stats = Stats()
+        events = []
+        stats.hooks.append(lambda *args: events.append(args))
+        stats.incr('get_hit')
+        stats.incr('get_hit')
+        stats.observe('ddl', 0.002)
+        stats.observe('ddl', 10)
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['counters'], {'get_hit': 2})
+        ddl = snapshot['timers']['ddl']
+        self.assertEqual(ddl['count'], 2)
+        self.assertEqual(ddl['max'], 10)
+        self.assertEqual(len(ddl['buckets']), len(BUCKETS) + 1)
+        self.assertEqual(ddl['buckets'][3], [0.005, 1])
+        self.assertEqual(ddl['buckets'][-1], [None, 1])
+        self.assertEqual(events, [
+            ('get_hit', None), ('get_hit', None), ('ddl', 0.002), ('ddl', 10)])
+
+
+class TestRegistryStats(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.base.metadata.drop_all()
+
+    def test_disabled(self):
+        reg = Registry(self.base, self.session)
+        reg.add('animal', 'bird', columns=[dict(name='name', kind='String')])
+        self.assertIsNone(reg.stats())
+
+    def test_registry(self):
+        reg = Registry(self.base, self.session, instrument=True)
+        reg.add_many([
+            {'collection': 'animal', 'name': 'bird', 'columns': [
+                dict(name='name', kind='String'),
+            ]},
+            {'collection': 'animal', 'name': 'egg', 'columns': [
+                dict(name='bird', kind='Relation',
+                     relation=dict(collection='animal', name='bird',
+                                   cardinality='one', backref='eggs')),
+            ]},
+        ])
+        reg.add_column('animal', 'bird', dict(name='color', kind='String'))
+        reg.get('animal', 'bird')
+
+        stats = reg.stats()
+        self.assertEqual(stats['counters'], {'get_hit': 3})
+        timers = stats['timers']
+        self.assertEqual(timers['catalog_query']['count'], 2)
+        self.assertEqual(timers['model_build']['count'], 2)
+        self.assertEqual(timers['relationship']['count'], 1)
+        self.assertEqual(timers['ddl']['count'], 2)
+
+        base = declarative_base(bind=self.session.get_bind())
+        lazy = Registry(base, self.session, lazy=True)
+        events = []
+        lazy.add_hook(lambda event, duration: events.append(event))
+        lazy.get('animal', 'egg')
+        self.assertEqual(lazy.stats()['counters'], {'get_miss': 2})
+        self.assertEqual(events.count('model_build'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
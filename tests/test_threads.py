@@ -0,0 +1,203 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.models import DTable
+
+
+class TestThreadSafeRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine(
+            'sqlite:///%s' % os.path.join(self.tmpdir, 'db.sqlite'),
+            connect_args={'check_same_thread': False})
+        self.factory = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _registry(self, **kwargs):
+        base = declarative_base(bind=self.engine)
+        return Registry(base, self.factory, thread_safe=True, **kwargs)
+
+    def test_session_per_thread(self):
+        reg = self._registry()
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(reg.session()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], reg.session())
+
+    def test_single_flight_build(self):
+        reg = self._registry()
+        reg.add_many([
+            {'collection': 'animal', 'name': 'bird', 'columns': [
+                dict(name='name', kind='String'),
+            ]},
+            {'collection': 'animal', 'name': 'egg', 'columns': [
+                dict(name='bird', kind='Relation',
+                     relation=dict(collection='animal', name='bird',
+                                   cardinality='one', backref='eggs')),
+            ]},
+        ])
+
+        lazy = self._registry(lazy=True)
+        barrier = threading.Barrier(8)
+        built = []
+        to_sa = DTable.to_sa
+
+        def counted(table, registry):
+            built.append(table.name)
+            return to_sa(table, registry)
+
+        def get(_):
+            barrier.wait()
+            return lazy.get('animal', 'egg')
+
+        with mock.patch.object(DTable, 'to_sa', counted):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                eggs = list(executor.map(get, range(8)))
+        self.assertEqual(sorted(built), ['bird', 'egg'])
+        self.assertTrue(all(egg is eggs[0] for egg in eggs))
+
+    def test_interleaved_builds(self):
+        reg = self._registry()
+        reg.add_many([
+            {'collection': 'food', 'name': 'food', 'columns': [
+                dict(name='name', kind='String'),
+            ]},
+            {'collection': 'animal', 'name': 'bird', 'columns': [
+                dict(name='foods', kind='Relation',
+                     relation=dict(collection='food', name='food',
+                                   cardinality='many', backref='eaters')),
+            ]},
+        ])
+
+        # each thread starts building one end of the bird <-> association
+        # cycle, then waits for the other one to start too
+        lazy = self._registry(lazy=True)
+        barrier = threading.Barrier(2)
+        to_sa = DTable.to_sa
+
+        def interleaved(table, registry):
+            try:
+                barrier.wait(0.5)
+            except threading.BrokenBarrierError:
+                pass
+            return to_sa(table, registry)
+
+        models = {}
+
+        def get(name):
+            models[name] = lazy.get('animal', name)
+
+        names = ['bird', 'bird__food__association']
+        threads = [threading.Thread(target=get, args=(name,), daemon=True)
+                   for name in names]
+        with mock.patch.object(DTable, 'to_sa', interleaved):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(sorted(models), names)
+        self.assertIs(models['bird'].foods.property.secondary,
+                      models['bird__food__association'].__table__)
+
+    def test_get_during_add_many(self):
+        reg = self._registry()
+        reg.add('food', 'food', columns=[dict(name='name', kind='String')])
+        published = threading.Event()
+        resume = threading.Event()
+        many_relationship = Registry._many_relationship
+
+        def paused(registry, col):
+            # bird is published, its foods attribute is not set yet
+            published.set()
+            resume.wait(10)
+            return many_relationship(registry, col)
+
+        def add():
+            reg.add('animal', 'bird', columns=[
+                dict(name='foods', kind='Relation',
+                     relation=dict(collection='food', name='food',
+                                   cardinality='many')),
+            ])
+
+        found = []
+
+        def get():
+            found.append(hasattr(reg.get('animal', 'bird'), 'foods'))
+
+        with mock.patch.object(Registry, '_many_relationship', paused):
+            adding = threading.Thread(target=add, daemon=True)
+            adding.start()
+            self.assertTrue(published.wait(10))
+            getting = threading.Thread(target=get, daemon=True)
+            getting.start()
+            getting.join(0.2)
+            resume.set()
+            adding.join(10)
+            getting.join(10)
+        self.assertEqual(found, [True])
+
+    def test_refresh_during_ddl(self):
+        reg = self._registry()
+        reg.add('animal', 'bird', columns=[dict(name='name', kind='String')])
+        reg.refresh()
+        started = threading.Event()
+        resume = threading.Event()
+        alter_statements = Registry._alter_statements
+
+        def paused(registry, sa_table, cols):
+            started.set()
+            resume.wait(10)
+            return alter_statements(registry, sa_table, cols)
+
+        with mock.patch.object(Registry, '_alter_statements', paused):
+            adding = threading.Thread(target=reg.add_column, args=(
+                'animal', 'bird', dict(name='color', kind='String')),
+                daemon=True)
+            adding.start()
+            self.assertTrue(started.wait(10))
+            refreshed = []
+            refreshing = threading.Thread(
+                target=lambda: refreshed.append(reg.refresh()), daemon=True)
+            refreshing.start()
+            refreshing.join(10)
+            resume.set()
+            adding.join(10)
+        self.assertEqual(refreshed, [[]])
+
+    def test_concurrent_add(self):
+        reg = self._registry()
+
+        def add(i):
+            return reg.add('animal', 'bird%d' % i, columns=[
+                dict(name='name', kind='String'),
+            ])
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            models = list(executor.map(add, range(8)))
+        self.assertEqual(set(reg.list('animal')), set(models))
+
+        other = self._registry()
+        self.assertEqual(
+            sorted(model.__tablename__ for model in other.list('animal')),
+            ['animal__bird%d' % i for i in range(8)])
+
+
+if __name__ == '__main__':
+    unittest.main()
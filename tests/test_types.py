@@ -0,0 +1,98 @@
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.models import DColumn, InvalidDefinitionException
+from dynalchemy.types import compress, decompress
+
+
+class TestCompress(unittest.TestCase):
+
+    def test_compress(self):
+        data = b'spam' * 100
+        for codec in ('zlib', 'lzma'):
+            stored = compress(data, codec)
+            self.assertLess(len(stored), len(data))
+            self.assertEqual(decompress(stored), data)
+        self.assertEqual(compress(data, 'zlib', threshold=1000), b'\x00' + data)
+        self.assertEqual(compress(b'spam'), b'\x00spam')
+        self.assertEqual(decompress(memoryview(b'\x00spam')), b'spam')
+
+
+class TestCompressedKinds(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=self.engine)
+        self.reg = Registry(self.base, sessionmaker(bind=self.engine)())
+
+    def tearDown(self):
+        self.base.metadata.drop_all()
+
+    def test_kinds(self):
+        Doc = self.reg.add('archive', 'doc', columns=[
+            dict(name='body', kind='CompressedText', codec='lzma'),
+            dict(name='note', kind='CompressedText', threshold=100),
+        ])
+        self.reg.add_column('archive', 'doc',
+                            dict(name='scan', kind='CompressedBinary'))
+        session = self.reg.session
+        session.add(Doc(body='lorem ipsum ' * 1000, note='short' * 10,
+                        scan=b'\x00' * 1000))
+        session.commit()
+        session.expunge_all()
+
+        doc = session.query(Doc).one()
+        self.assertEqual(doc.body, 'lorem ipsum ' * 1000)
+        self.assertEqual(doc.note, 'short' * 10)
+        self.assertEqual(doc.scan, b'\x00' * 1000)
+
+        body, note, scan = self.engine.execute(
+            'select body, note, scan from archive__doc').first()
+        self.assertEqual(body[:1], b'\x02')
+        self.assertLess(len(body), 1000)
+        self.assertEqual(note, b'\x00' + b'short' * 10)
+        self.assertEqual(scan[:1], b'\x01')
+
+        # a new registry reads the codecs from the catalog
+        base = declarative_base(bind=self.engine)
+        Doc = Registry(base, sessionmaker(bind=self.engine)())\
+            .get('archive', 'doc')
+        self.assertEqual(Doc.__table__.c.body.type.codec, 'lzma')
+        self.assertEqual(Doc.__table__.c.note.type.threshold, 100)
+
+    def test_bulk_upsert(self):
+        Doc = self.reg.add('archive', 'doc', columns=[
+            dict(name='code', kind='String'),
+            dict(name='body', kind='CompressedText', codec='lzma'),
+            dict(name='scan', kind='CompressedBinary'),
+        ], unique_keys=[['code']])
+        for body, scan in (('draft', b'\x00'), ('lorem ipsum ' * 1000,
+                                                  b'\x01' * 1000)):
+            self.reg.bulk_upsert('archive', 'doc', [
+                {'code': 'a', 'body': body, 'scan': scan},
+                {'code': 'b', 'body': body, 'scan': scan},
+            ], key=['code'])
+
+        session = self.reg.session
+        session.expire_all()
+        docs = session.query(Doc).order_by(Doc.code).all()
+        self.assertEqual([(doc.code, doc.body, doc.scan) for doc in docs], [
+            (code, 'lorem ipsum ' * 1000, b'\x01' * 1000)
+            for code in 'ab'])
+        for body, scan in self.engine.execute(
+                'select body, scan from archive__doc'):
+            self.assertEqual(body[:1], b'\x02')
+            self.assertEqual(scan[:1], b'\x01')
+            self.assertLess(len(body), 1000)
+
+    def test_validate(self):
+        self.assertRaises(InvalidDefinitionException, DColumn(
+            name='body', kind='CompressedText', codec='bz2').validate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from datetime import datetime
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateTable
+
+from dynalchemy import Registry
+from dynalchemy.meta import InvalidDefinitionException
+from dynalchemy.upsert import upsert_select
+
+
+class TestUpsert(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.Bird = self.reg.add('animal', 'bird', columns=[
+            dict(name='code', kind='String'),
+            dict(name='region', kind='String'),
+            dict(name='name', kind='String', nullable=True),
+            dict(name='nb_wings', kind='Integer', nullable=True),
+        ], unique_keys=[['code', 'region']])
+
+    def tearDown(self):
+        self.reg.destroy()
+
+    def _birds(self):
+        self.reg.session.expire_all()
+        return [(bird.code, bird.region, bird.name, bird.nb_wings)
+                for bird in self.reg.session.query(self.Bird)
+                .order_by(self.Bird.id)]
+
+    def test_unique_key(self):
+        self.reg.bulk_insert('animal', 'bird', [
+            {'code': 'a', 'region': 'eu'}])
+        self.assertRaises(IntegrityError, self.reg.bulk_insert,
+                          'animal', 'bird', [{'code': 'a', 'region': 'eu'}])
+
+    def test_bulk_upsert(self):
+        self.reg.bulk_insert('animal', 'bird', [
+            {'code': 'a', 'region': 'eu', 'name': 'pinson', 'nb_wings': 2}])
+        counts = self.reg.bulk_upsert('animal', 'bird', [
+            {'code': 'a', 'region': 'eu', 'name': 'merle', 'nb_wings': '2'},
+            {'code': 'a', 'region': 'us', 'name': 'robin', 'nb_wings': '2'},
+            {'code': 'b', 'region': 'eu', 'name': 'crow', 'nb_wings': '2'},
+        ], key=['code', 'region'], chunk_size=2)
+        self.assertEqual(counts, [2, 1])
+        self.assertEqual(self._birds(), [
+            ('a', 'eu', 'merle', 2),
+            ('a', 'us', 'robin', 2),
+            ('b', 'eu', 'crow', 2)])
+
+    def test_bulk_upsert_typed(self):
+        Note = self.reg.add('animal', 'note', columns=[
+            dict(name='code', kind='String'),
+            dict(name='body', kind='CompressedText'),
+            dict(name='seen', kind='DateTime'),
+        ], unique_keys=[['code']])
+        body = 'tweet ' * 100
+        for seen in ('2017-03-13T09:24:58', '2018-05-01T12:00:00'):
+            self.reg.bulk_upsert('animal', 'note', [
+                {'code': 'a', 'body': body, 'seen': seen}], key=['code'])
+        self.reg.session.expire_all()
+        note = self.reg.session.query(Note).one()
+        self.assertEqual(note.body, body)
+        self.assertEqual(note.seen, datetime(2018, 5, 1, 12))
+
+    def test_unique_column_key(self):
+        Ring = self.reg.add('animal', 'ring', columns=[
+            dict(name='code', kind='String', unique=True),
+            dict(name='color', kind='String'),
+        ])
+        for color in ('red', 'blue'):
+            self.reg.bulk_upsert('animal', 'ring', [
+                {'code': 'a', 'color': color}], key=['code'])
+        self.assertEqual(
+            [(ring.code, ring.color)
+             for ring in self.reg.session.query(Ring)], [('a', 'blue')])
+
+    def test_long_key_name(self):
+        name = 'observation_%s' % ('x' * 40)
+        Obs = self.reg.add('animal', name, columns=[
+            dict(name='station_code', kind='String'),
+            dict(name='observed_on', kind='Date'),
+        ], unique_keys=[['station_code', 'observed_on']])
+        ddl = str(CreateTable(Obs.__table__).compile(
+            dialect=postgresql.dialect()))
+        constraint = ddl.split('CONSTRAINT ')[-1].split()[0]
+        self.assertLessEqual(len(constraint), 63)
+        self.reg.bulk_upsert('animal', name, [
+            dict(station_code='a', observed_on='2020-01-01')],
+            key=['station_code', 'observed_on'])
+
+    def test_undeclared_key(self):
+        self.assertRaises(InvalidDefinitionException, self.reg.bulk_upsert,
+                          'animal', 'bird', [], key=['name'])
+
+    def test_upsert_select(self):
+        self.reg.bulk_insert('animal', 'bird', [
+            {'code': 'a', 'region': 'eu', 'name': 'pinson'}])
+        table = self.Bird.__table__
+        with self.reg.session.get_bind().begin() as con:
+            upsert_select(con, table, ('code', 'region'), [
+                {'code': 'a', 'region': 'eu', 'name': 'merle'},
+                {'code': 'b', 'region': 'eu', 'name': 'crow'},
+                {'code': 'b', 'region': 'eu', 'name': 'raven'},
+            ])
+        self.assertEqual(self._birds(), [
+            ('a', 'eu', 'merle', None),
+            ('b', 'eu', 'raven', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
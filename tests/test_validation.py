@@ -0,0 +1,95 @@
+import datetime
+import unittest
+
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from dynalchemy import Registry
+from dynalchemy.validation import FieldError
+
+
+class TestRowValidator(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        self.base = declarative_base(bind=engine)
+        self.reg = Registry(self.base, sessionmaker(bind=engine)())
+        self.reg.add('animal', 'bird', columns=[
+            dict(name='name', kind='String', length=10),
+            dict(name='size', kind='Enum', choices=['small', 'big'],
+                 nullable=True),
+            dict(name='weight', kind='Float', precision=3, nullable=True),
+            dict(name='wings', kind='Integer', default='2'),
+            dict(name='born', kind='Date', nullable=True),
+            dict(name='flying', kind='Boolean', nullable=True),
+        ])
+
+    def tearDown(self):
+        self.base.metadata.drop_all()
+
+    def test_validate(self):
+        validator = self.reg.validator('animal', 'bird')
+        values, errors = validator.validate(dict(
+            name='pinson', weight='1.5', born='2020-05-01'))
+        self.assertEqual(errors, [])
+        self.assertEqual(values, dict(
+            name='pinson', weight=1.5, wings=2,
+            born=datetime.date(2020, 5, 1)))
+
+        values, errors = validator.validate(dict(
+            name='a very long name', size='huge', weight=1.2345,
+            wings='two', color='red'))
+        self.assertEqual(sorted((e.field, e.code) for e in errors), [
+            ('color', 'unknown'), ('name', 'length'), ('size', 'choice'),
+            ('weight', 'precision'), ('wings', 'type')])
+        self.assertEqual(values, {})
+
+    def test_strict(self):
+        validator = self.reg.validator('animal', 'bird')
+        values, errors = validator.validate(dict(
+            name='pinson', wings=4.0, flying='No'))
+        self.assertEqual(errors, [])
+        self.assertEqual(values, dict(name='pinson', wings=4, flying=False))
+        self.assertEqual(validator.validate(dict(
+            name=12, wings='3', flying=1))[0],
+            dict(name='12', wings=3, flying=True))
+
+        for field, value in [('flying', 'banana'), ('flying', 2),
+                             ('wings', 3.7), ('wings', '3.7'),
+                             ('wings', True), ('wings', float('inf')),
+                             ('name', {'en': 'finch'}), ('name', ['finch']),
+                             ('id', 1.5)]:
+            values, errors = validator.validate({'name': 'x', field: value})
+            self.assertEqual([(e.field, e.code) for e in errors],
+                             [(field, 'type')], value)
+            self.assertNotIn(field, values)
+
+    def test_validate_many(self):
+        validator = self.reg.validator('animal', 'bird')
+        rows, errors = validator.validate_many([
+            dict(name='pinson'), dict(size='big'), dict(name=None)])
+        self.assertEqual([row.get('name') for row in rows],
+                         ['pinson', None, None])
+        self.assertEqual(errors, [
+            FieldError(1, 'name', 'required', 'value is mandatory'),
+            FieldError(2, 'name', 'required', 'value is mandatory')])
+
+    def test_cache(self):
+        validator = self.reg.validator('animal', 'bird')
+        self.assertIs(self.reg.validator('animal', 'bird'), validator)
+
+        self.reg.add_column('animal', 'bird',
+                            dict(name='color', kind='String', nullable=True))
+        validator = self.reg.validator('animal', 'bird')
+        self.assertEqual(validator.validate(dict(name='merle', color='black'))[1],
+                         [])
+
+        self.reg.deprecate_column('animal', 'bird', 'color')
+        errors = self.reg.validator('animal', 'bird').validate(
+            dict(name='merle', color='black'))[1]
+        self.assertEqual([e.code for e in errors], ['unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()